@@ -3,12 +3,14 @@ FastAPI backend for Agentic RAG Web Application
 Provides REST API for chat and conversation management
 """
 
+import asyncio
 import os
 import uuid
-from typing import List
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from datetime import datetime
+from typing import List, Optional
+from fastapi import BackgroundTasks, FastAPI, HTTPException
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import sys
 
 # Add parent directory to path to import agentic_rag
@@ -19,30 +21,87 @@ from backend.models import (
     ChatRequest,
     ChatResponse,
     ConversationListItem,
+    ConversationListResponse,
     NewConversationResponse,
     Message
 )
-from backend.database import db
+from backend.database import get_db
+from pydantic import TypeAdapter
+
+# Precompiled validators - reused across requests instead of letting
+# FastAPI re-validate response_model objects on every call
+_CHAT_RESPONSE = TypeAdapter(ChatResponse)
+_CONV_PAGE = TypeAdapter(ConversationListResponse)
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Agentic RAG API",
     description="REST API for Agentic RAG chatbot with conversation management",
-    version="1.0.0"
+    version="1.0.0",
+    # orjson serializes responses (datetimes included) several times
+    # faster than the stdlib json used by the default JSONResponse
+    default_response_class=ORJSONResponse
 )
 
+
+class FastCORS:
+    """
+    Minimal pure-ASGI CORS middleware
+
+    Short-circuits preflight OPTIONS requests and appends a static set of
+    access-control headers without building Starlette Request/Response
+    objects - lighter than CORSMiddleware on the /api/chat hot path.
+    """
+
+    def __init__(self, app, allow_origin: bytes = b"*"):
+        self.app = app
+        self._headers = [
+            (b"access-control-allow-origin", allow_origin),
+            (b"access-control-allow-methods", b"*"),
+            (b"access-control-allow-headers", b"*"),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        # Answer preflight requests immediately
+        if scope["method"] == "OPTIONS":
+            await send({
+                "type": "http.response.start",
+                "status": 204,
+                "headers": self._headers
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + self._headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+
 # CORS middleware - allow frontend to communicate with backend
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # In production, specify exact origins
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# (in production, specify exact origins)
+app.add_middleware(FastCORS)
 
 # Initialize Agentic RAG system (lazy loading)
 agentic_rag: AgenticRAG = None
 
+# Strong references to fire-and-forget tasks - the event loop only keeps
+# weak refs, so an unreferenced task can be garbage-collected mid-flight
+_background_tasks: set = set()
+
+
+def _spawn_background(coro):
+    """Schedule a background coroutine and keep it referenced until done"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
 
 def get_agentic_rag() -> AgenticRAG:
     """Get or initialize Agentic RAG system"""
@@ -60,14 +119,34 @@ async def startup_event():
     print("=" * 60)
     print("🚀 Starting Agentic RAG Backend API")
     print("=" * 60)
-    get_agentic_rag()
+
+    await get_db().init_indexes()
+    rag = get_agentic_rag()
+
+    # Warm up the pipeline so the first real request doesn't pay the
+    # one-time cost of embedding-model load, HNSW mmap touch, and the
+    # first OpenAI TLS handshake. Must run BEFORE set_llm_cache below,
+    # otherwise the ping is answered from .llm_cache.db on every restart
+    # and never opens a connection
+    try:
+        await run_in_threadpool(rag.vectorstore.similarity_search, "warmup", 1)
+        await run_in_threadpool(rag.llm.invoke, "ping")
+        print("✅ Warmup complete (embeddings, vectorstore, LLM)")
+    except Exception as e:
+        print(f"⚠️ Warmup failed (continuing anyway): {e}")
+
+    # Global LLM cache - identical prompts (title generation, repeated
+    # agent sub-prompts) reuse cached results instead of new API calls
+    from langchain_core.globals import set_llm_cache
+    from langchain_community.cache import SQLiteCache
+    set_llm_cache(SQLiteCache(database_path=".llm_cache.db"))
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
     print("👋 Shutting down Agentic RAG Backend API")
-    db.close()
+    get_db().close()
 
 
 @app.get("/")
@@ -80,6 +159,7 @@ async def root():
         "endpoints": {
             "health": "/api/health",
             "chat": "/api/chat",
+            "chat_stream": "/api/chat/stream",
             "conversations": "/api/conversations",
             "new_conversation": "/api/conversations/new",
             "delete_conversation": "/api/conversations/{session_id}"
@@ -117,8 +197,8 @@ async def get_config():
     }
 
 
-@app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+@app.post("/api/chat")
+async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
     """
     Send message and get response
     
@@ -130,59 +210,101 @@ async def chat(request: ChatRequest):
     """
     try:
         rag = get_agentic_rag()
-        
+        db = get_db()
+
         # Get conversation history
-        conversation_history = db.get_conversation_history(request.session_id)
-        
-        # Save user message
-        db.save_message(
-            session_id=request.session_id,
-            role="user",
-            content=request.message,
-            metadata={}
-        )
-        
+        conversation_history = await db.get_conversation_history(request.session_id)
+
         # Get response from Agentic RAG
-        result = rag.query(
-            question=request.message,
-            conversation_history=conversation_history
+        result = await run_in_threadpool(
+            rag.query, request.message, conversation_history
         )
-        
-        # Save assistant response
-        db.save_message(
-            session_id=request.session_id,
-            role="assistant",
-            content=result["answer"],
-            metadata={
+
+        # Save both messages of the turn in one batched write
+        first_turn = await db.save_turn(
+            request.session_id,
+            request.message,
+            result["answer"],
+            {
                 "confidence": result.get("confidence"),
                 "citations": result.get("citations"),
                 "metadata": result.get("metadata")
             }
         )
-        
-        return ChatResponse(
-            answer=result["answer"],
-            session_id=request.session_id,
-            confidence=result.get("confidence"),
-            citations=result.get("citations"),
-            metadata=result.get("metadata")
-        )
+
+        # Refine the heuristic title with the LLM after responding
+        if first_turn:
+            background_tasks.add_task(db.refine_title, request.session_id, request.message)
+
+        return _CHAT_RESPONSE.dump_python(_CHAT_RESPONSE.validate_python({
+            "answer": result["answer"],
+            "session_id": request.session_id,
+            "confidence": result.get("confidence"),
+            "citations": result.get("citations"),
+            "metadata": result.get("metadata")
+        }))
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing chat: {str(e)}")
 
 
-@app.get("/api/conversations", response_model=List[ConversationListItem])
-async def get_conversations():
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
     """
-    Get all conversations list
-    
+    Send message and stream the response via Server-Sent Events
+
+    Tokens are flushed to the client as the reasoning LLM produces them,
+    so the user sees output immediately instead of waiting for the whole
+    agent pipeline. The completed turn is persisted when the stream ends.
+
+    Args:
+        request: ChatRequest with message and session_id
+
+    Returns:
+        SSE stream of answer chunks, terminated by an 'event: done' frame
+    """
+    rag = get_agentic_rag()
+    db = get_db()
+    conversation_history = await db.get_conversation_history(request.session_id)
+
+    async def event_generator():
+        chunks = []
+        async for token in rag.astream(request.message, conversation_history):
+            chunks.append(token)
+            # SSE data frames must be single-line; split multi-line tokens
+            for line in token.split("\n"):
+                yield f"data: {line}\n"
+            yield "\n"
+
+        first_turn = await db.save_turn(
+            request.session_id,
+            request.message,
+            "".join(chunks),
+            {}
+        )
+        if first_turn:
+            _spawn_background(db.refine_title(request.session_id, request.message))
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+
+@app.get("/api/conversations")
+async def get_conversations(limit: int = 50, before: Optional[str] = None):
+    """
+    Get paginated conversations list
+
+    Args:
+        limit: Max conversations per page (default 50)
+        before: Cursor from the previous page (ISO timestamp)
+
     Returns:
-        List of conversation summaries
+        Page of conversation summaries plus a cursor for the next page
     """
     try:
-        conversations = db.get_all_conversations()
-        return conversations
+        before_dt = datetime.fromisoformat(before) if before else None
+        page = await get_db().get_all_conversations(limit=limit, before=before_dt)
+        return _CONV_PAGE.dump_python(_CONV_PAGE.validate_python(page))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching conversations: {str(e)}")
 
@@ -199,7 +321,7 @@ async def get_conversation(session_id: str):
         Conversation with messages
     """
     try:
-        conversation = db.get_conversation(session_id)
+        conversation = await get_db().get_conversation(session_id)
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
         return conversation
@@ -219,7 +341,7 @@ async def create_new_conversation():
     """
     try:
         session_id = str(uuid.uuid4())
-        db.create_session(session_id)
+        await get_db().create_session(session_id)
         return NewConversationResponse(
             session_id=session_id,
             message="New conversation created"
@@ -240,7 +362,7 @@ async def delete_conversation(session_id: str):
         Success message
     """
     try:
-        success = db.delete_conversation(session_id)
+        success = await get_db().delete_conversation(session_id)
         if not success:
             raise HTTPException(status_code=404, detail="Conversation not found")
         return {"message": "Conversation deleted successfully", "session_id": session_id}
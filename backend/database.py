@@ -3,9 +3,11 @@ MongoDB database integration for chat history and conversation management
 """
 
 import os
-from datetime import datetime
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
-from pymongo import MongoClient, DESCENDING
+from pymongo import InsertOne, ReturnDocument, DESCENDING
+from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 
@@ -20,40 +22,71 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 
 class Database:
-    """MongoDB database manager"""
-    
+    """Async MongoDB database manager (Motor)"""
+
     def __init__(self):
         """Initialize MongoDB connection"""
-        self.client = MongoClient(MONGODB_URI)
+        # Explicit pool/timeout tuning: fail fast on connection problems
+        # instead of hanging 30s, keep warm sockets ready under load, and
+        # compress chat payloads on the wire (zstd with snappy fallback)
+        self.client = AsyncIOMotorClient(
+            MONGODB_URI,
+            maxPoolSize=50,
+            minPoolSize=10,
+            serverSelectionTimeoutMS=3000,
+            socketTimeoutMS=10000,
+            compressors="zstd,snappy",
+            retryWrites=True
+        )
         self.db = self.client[MONGODB_DATABASE]
         self.sessions = self.db["sessions"]
         self.messages = self.db["messages"]
-        
-        # Create indexes for performance
-        self.sessions.create_index("session_id", unique=True)
-        self.sessions.create_index([("updated_at", DESCENDING)])
-        self.messages.create_index("session_id")
-        self.messages.create_index([("timestamp", DESCENDING)])
-        
+
+        # In-process cache of recent conversation histories, keyed by
+        # session_id - avoids re-reading and re-sorting messages from Mongo
+        # on every chat turn when the backend just wrote them
+        self._history_cache: "OrderedDict[str, List[Dict[str, str]]]" = OrderedDict()
+        self._history_cache_size = 1024
+
         # Initialize LLM for title generation
+        # temperature=0 keeps outputs deterministic so the global LLM cache
+        # can reuse results for repeated first messages
         self.llm = ChatOpenAI(
             model="gpt-4o-mini",
-            temperature=0.3,
+            temperature=0,
             max_tokens=50,
             api_key=OPENAI_API_KEY
         )
-    
-    def create_session(self, session_id: str) -> Dict[str, Any]:
+
+    async def init_indexes(self):
+        """Create indexes for performance (call once at startup)"""
+        await self.sessions.create_index("session_id", unique=True)
+
+        # Compound index: history reads filter by session_id and sort by
+        # timestamp - one IXSCAN, no blocking in-memory SORT
+        await self.messages.create_index([("session_id", 1), ("timestamp", 1)])
+
+        # Covering index for the conversation list view: includes every
+        # field projected by get_all_conversations so Mongo answers the
+        # query from the index alone without fetching documents
+        await self.sessions.create_index([
+            ("updated_at", DESCENDING),
+            ("session_id", 1),
+            ("title", 1),
+            ("message_count", 1)
+        ])
+
+    async def create_session(self, session_id: str) -> Dict[str, Any]:
         """
         Create new conversation session
-        
+
         Args:
             session_id: Unique session ID
-            
+
         Returns:
             Created session document
         """
-        now = datetime.now()
+        now = datetime.utcnow()
         session = {
             "session_id": session_id,
             "title": None,  # Will be set after first message
@@ -61,76 +94,105 @@ class Database:
             "updated_at": now,
             "message_count": 0
         }
-        
-        self.sessions.insert_one(session)
+
+        await self.sessions.insert_one(session)
         return session
-    
-    def get_all_conversations(self) -> List[Dict[str, Any]]:
+
+    async def get_all_conversations(
+        self,
+        limit: int = 50,
+        before: Optional[datetime] = None
+    ) -> Dict[str, Any]:
         """
-        Get all conversations sorted by last update
-        
+        Get conversations sorted by last update, paginated by keyset
+
+        Args:
+            limit: Max number of conversations per page
+            before: Only return conversations updated before this time
+                    (cursor from the previous page)
+
         Returns:
-            List of conversation summaries
+            Dict with "items" (conversation summaries) and "next"
+            (cursor for the next page, None if exhausted)
         """
-        conversations = list(
-            self.sessions.find(
-                {},
-                {"_id": 0, "session_id": 1, "title": 1, "updated_at": 1, "message_count": 1}
-            ).sort("updated_at", DESCENDING)
-        )
-        
+        query = {} if before is None else {"updated_at": {"$lt": before}}
+        cursor = self.sessions.find(
+            query,
+            {"_id": 0, "session_id": 1, "title": 1, "updated_at": 1, "message_count": 1}
+        ).sort("updated_at", DESCENDING).limit(limit)
+        conversations = await cursor.to_list(length=limit)
+
         # Set default title for conversations without one
         for conv in conversations:
             if not conv.get("title"):
                 conv["title"] = "New Conversation"
-        
-        return conversations
-    
-    def get_conversation(self, session_id: str) -> Optional[Dict[str, Any]]:
+
+        next_cursor = (
+            conversations[-1]["updated_at"].isoformat()
+            if len(conversations) == limit else None
+        )
+
+        return {"items": conversations, "next": next_cursor}
+
+    async def get_conversation(self, session_id: str) -> Optional[Dict[str, Any]]:
         """
         Get full conversation with messages
-        
+
         Args:
             session_id: Session ID
-            
+
         Returns:
             Conversation with messages or None if not found
         """
-        session = self.sessions.find_one({"session_id": session_id}, {"_id": 0})
-        if not session:
+        # Single aggregation round trip: session + its sorted messages via
+        # $lookup instead of two separate queries
+        pipeline = [
+            {"$match": {"session_id": session_id}},
+            {"$lookup": {
+                "from": "messages",
+                "let": {"sid": "$session_id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$session_id", "$$sid"]}}},
+                    {"$sort": {"timestamp": 1}},
+                    {"$project": {"_id": 0}}
+                ],
+                "as": "messages"
+            }},
+            {"$project": {"_id": 0}}
+        ]
+
+        docs = await self.sessions.aggregate(pipeline).to_list(length=1)
+        if not docs:
             return None
-        
-        messages = list(
-            self.messages.find(
-                {"session_id": session_id},
-                {"_id": 0}
-            ).sort("timestamp", 1)
-        )
-        
+
+        doc = docs[0]
+        messages = doc.pop("messages")
         return {
-            "session": session,
+            "session": doc,
             "messages": messages
         }
-    
-    def delete_conversation(self, session_id: str) -> bool:
+
+    async def delete_conversation(self, session_id: str) -> bool:
         """
         Delete conversation and all its messages
-        
+
         Args:
             session_id: Session ID
-            
+
         Returns:
             True if deleted successfully
         """
+        self._history_cache.pop(session_id, None)
+
         # Delete session
-        result = self.sessions.delete_one({"session_id": session_id})
-        
+        result = await self.sessions.delete_one({"session_id": session_id})
+
         # Delete all messages
-        self.messages.delete_many({"session_id": session_id})
-        
+        await self.messages.delete_many({"session_id": session_id})
+
         return result.deleted_count > 0
-    
-    def save_message(
+
+    async def save_message(
         self,
         session_id: str,
         role: str,
@@ -139,24 +201,18 @@ class Database:
     ) -> Dict[str, Any]:
         """
         Save message to database and auto-generate title if first message
-        
+
         Args:
             session_id: Session ID
             role: 'user' or 'assistant'
             content: Message content
             metadata: Optional metadata
-            
+
         Returns:
             Saved message document
         """
-        now = datetime.now()
-        
-        # Create session if it doesn't exist
-        session = self.sessions.find_one({"session_id": session_id})
-        if not session:
-            self.create_session(session_id)
-            session = self.sessions.find_one({"session_id": session_id})
-        
+        now = datetime.utcnow()
+
         # Save message
         message = {
             "session_id": session_id,
@@ -165,35 +221,151 @@ class Database:
             "timestamp": now,
             "metadata": metadata or {}
         }
-        self.messages.insert_one(message)
-        
-        # Update session
-        message_count = self.messages.count_documents({"session_id": session_id})
-        
-        update_data = {
-            "updated_at": now,
-            "message_count": message_count
-        }
-        
-        # Auto-generate title if this is the first user message
-        if role == "user" and not session.get("title"):
-            title = self.generate_conversation_title(content)
-            update_data["title"] = title
-        
-        self.sessions.update_one(
+        await self.messages.insert_one(message)
+
+        # Update session in a single round trip: bump the counter, refresh
+        # updated_at, and create the session if it doesn't exist yet
+        session = await self.sessions.find_one_and_update(
             {"session_id": session_id},
-            {"$set": update_data}
+            {
+                "$inc": {"message_count": 1},
+                "$set": {"updated_at": now},
+                "$setOnInsert": {
+                    "session_id": session_id,
+                    "created_at": now,
+                    "title": None
+                }
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
         )
-        
+
+        cached = self._history_cache.get(session_id)
+        if cached is not None:
+            cached.append({"role": role, "content": content})
+
+        # Set a cheap heuristic title immediately; the LLM-refined title
+        # is applied later via refine_title so the reply isn't blocked
+        if role == "user" and not session.get("title"):
+            await self.sessions.update_one(
+                {"session_id": session_id, "title": None},
+                {"$set": {"title": self._cheap_title(content)}}
+            )
+
         return message
-    
-    def generate_conversation_title(self, first_message: str) -> str:
+
+    async def save_turn(
+        self,
+        session_id: str,
+        user_content: str,
+        assistant_content: str,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Save a full chat turn (user message + assistant reply) in one batch
+
+        Both messages are written with a single bulk_write and the session
+        is updated once, halving the round trips of two save_message calls.
+
+        Args:
+            session_id: Session ID
+            user_content: User message content
+            assistant_content: Assistant reply content
+            metadata: Optional metadata for the assistant message
+
+        Returns:
+            True if this was the first turn (title refinement needed)
+        """
+        now = datetime.utcnow()
+        # Strictly later timestamp for the reply: reads sort by timestamp
+        # and Mongo's order on equal keys is unspecified, so identical
+        # values could replay the assistant before the user
+        reply_ts = now + timedelta(milliseconds=1)
+
+        await self.messages.bulk_write(
+            [
+                InsertOne({
+                    "session_id": session_id,
+                    "role": "user",
+                    "content": user_content,
+                    "timestamp": now,
+                    "metadata": {}
+                }),
+                InsertOne({
+                    "session_id": session_id,
+                    "role": "assistant",
+                    "content": assistant_content,
+                    "timestamp": reply_ts,
+                    "metadata": metadata or {}
+                }),
+            ],
+            ordered=False
+        )
+
+        session = await self.sessions.find_one_and_update(
+            {"session_id": session_id},
+            {
+                "$inc": {"message_count": 2},
+                "$set": {"updated_at": reply_ts},
+                "$setOnInsert": {
+                    "session_id": session_id,
+                    "created_at": now,
+                    "title": None
+                }
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+        # Keep the cached history in sync instead of invalidating it
+        cached = self._history_cache.get(session_id)
+        if cached is not None:
+            cached.append({"role": "user", "content": user_content})
+            cached.append({"role": "assistant", "content": assistant_content})
+
+        # Set a cheap heuristic title immediately on the first turn; the
+        # caller should schedule refine_title in the background for the
+        # LLM-polished version
+        first_turn = not session.get("title")
+        if first_turn:
+            await self.sessions.update_one(
+                {"session_id": session_id, "title": None},
+                {"$set": {"title": self._cheap_title(user_content)}}
+            )
+
+        return first_turn
+
+    @staticmethod
+    def _cheap_title(content: str) -> str:
+        """Heuristic title: first ~50 chars of the message, capitalized"""
+        title = content.strip()
+        if len(title) > 50:
+            title = title[:47] + "..."
+        return title[:1].upper() + title[1:] if title else "New Conversation"
+
+    async def refine_title(self, session_id: str, first_message: str):
+        """
+        Replace the heuristic title with an LLM-generated one
+
+        Meant to run as a background task after the response is sent.
+
+        Args:
+            session_id: Session ID
+            first_message: First user message of the conversation
+        """
+        title = await self.generate_conversation_title(first_message)
+        await self.sessions.update_one(
+            {"session_id": session_id},
+            {"$set": {"title": title}}
+        )
+
+    async def generate_conversation_title(self, first_message: str) -> str:
         """
         Generate concise conversation title from first message using LLM
-        
+
         Args:
             first_message: First user message
-            
+
         Returns:
             Generated title (max 50 chars)
         """
@@ -209,43 +381,60 @@ Tiêu đề nên:
 - Viết hoa chữ cái đầu
 
 Chỉ trả về tiêu đề, không giải thích."""
-            
-            response = self.llm.invoke(prompt)
+
+            response = await self.llm.ainvoke(prompt)
             title = response.content.strip()
-            
+
             # Ensure max 50 characters
             if len(title) > 50:
                 title = title[:47] + "..."
-            
+
             return title
         except Exception as e:
             print(f"Error generating title: {e}")
             # Fallback: Use first 50 chars of message
             return first_message[:47] + "..." if len(first_message) > 50 else first_message
-    
-    def get_conversation_history(self, session_id: str) -> List[Dict[str, str]]:
+
+    async def get_conversation_history(self, session_id: str) -> List[Dict[str, str]]:
         """
         Get conversation history formatted for Agentic RAG
-        
+
         Args:
             session_id: Session ID
-            
+
         Returns:
             List of messages in format [{"role": "user/assistant", "content": "..."}]
         """
-        messages = list(
-            self.messages.find(
-                {"session_id": session_id},
-                {"_id": 0, "role": 1, "content": 1}
-            ).sort("timestamp", 1)
-        )
-        
+        cached = self._history_cache.get(session_id)
+        if cached is not None:
+            self._history_cache.move_to_end(session_id)
+            return cached
+
+        messages = await self.messages.find(
+            {"session_id": session_id},
+            {"_id": 0, "role": 1, "content": 1}
+        ).sort("timestamp", 1).to_list(length=None)
+
+        self._history_cache[session_id] = messages
+        if len(self._history_cache) > self._history_cache_size:
+            self._history_cache.popitem(last=False)
+
         return messages
-    
+
     def close(self):
         """Close database connection"""
         self.client.close()
 
 
-# Global database instance
-db = Database()
+# Lazy global database instance - created on first use so importing this
+# module doesn't open a Mongo connection (PyMongo/Motor clients are not
+# fork-safe; each worker must build its own post-fork)
+_db: Optional[Database] = None
+
+
+def get_db() -> Database:
+    """Get or initialize the per-process Database singleton"""
+    global _db
+    if _db is None:
+        _db = Database()
+    return _db
@@ -2,27 +2,30 @@
 Pydantic models for request/response validation
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
 
 class Message(BaseModel):
     """Individual message model"""
+    model_config = ConfigDict(extra="ignore")
     role: str = Field(..., description="Role: 'user' or 'assistant'")
     content: str = Field(..., description="Message content")
-    timestamp: Optional[datetime] = Field(default=None, description="Message timestamp")
+    timestamp: Optional[datetime] = Field(default=None, description="Message timestamp (UTC)")
     metadata: Optional[Dict[str, Any]] = Field(default=None, description="Additional metadata")
 
 
 class ChatRequest(BaseModel):
     """Chat message request"""
+    model_config = ConfigDict(extra="ignore")
     message: str = Field(..., description="User message")
     session_id: str = Field(..., description="Session/Conversation ID")
 
 
 class ChatResponse(BaseModel):
     """Chat response with metadata"""
+    model_config = ConfigDict(extra="ignore")
     answer: str = Field(..., description="Bot response")
     session_id: str = Field(..., description="Session/Conversation ID")
     confidence: Optional[float] = Field(default=None, description="Confidence score")
@@ -32,22 +35,32 @@ class ChatResponse(BaseModel):
 
 class Session(BaseModel):
     """Chat session model"""
+    model_config = ConfigDict(extra="ignore")
     session_id: str = Field(..., description="Unique session ID")
     title: Optional[str] = Field(default=None, description="Conversation title")
-    created_at: datetime = Field(default_factory=datetime.now, description="Creation timestamp")
-    updated_at: datetime = Field(default_factory=datetime.now, description="Last update timestamp")
+    created_at: datetime = Field(default_factory=datetime.utcnow, description="Creation timestamp (UTC)")
+    updated_at: datetime = Field(default_factory=datetime.utcnow, description="Last update timestamp (UTC)")
     message_count: int = Field(default=0, description="Number of messages in conversation")
 
 
 class ConversationListItem(BaseModel):
     """Conversation summary for sidebar"""
+    model_config = ConfigDict(extra="ignore")
     session_id: str = Field(..., description="Unique session ID")
     title: str = Field(default="New Conversation", description="Conversation title")
     updated_at: datetime = Field(..., description="Last update timestamp")
     message_count: int = Field(default=0, description="Number of messages")
 
 
+class ConversationListResponse(BaseModel):
+    """Paginated conversation list"""
+    model_config = ConfigDict(extra="ignore")
+    items: List[ConversationListItem] = Field(..., description="Conversations in this page")
+    next: Optional[str] = Field(default=None, description="Cursor for the next page (ISO timestamp)")
+
+
 class NewConversationResponse(BaseModel):
     """Response when creating new conversation"""
+    model_config = ConfigDict(extra="ignore")
     session_id: str = Field(..., description="New session ID")
     message: str = Field(default="New conversation created", description="Success message")
@@ -4,13 +4,24 @@ Hệ thống RAG với agents thông minh sử dụng LangGraph
 """
 
 from typing import Dict, Any, List, Literal
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
 from langchain_openai import ChatOpenAI
 from langchain_chroma import Chroma
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langgraph.graph import StateGraph, END
+import asyncio
+import logging
 import os
 
 from .config import model_config, vectorstore_config, agent_config, system_config
+from .memory import SummaryMemory
+from .semantic_cache import SemanticCache
+
+try:
+    from .query_normalizer import normalizer as _normalizer
+except ImportError:
+    _normalizer = None
 from .agents import (
     AgentState,
     QueryAnalyzerAgent,
@@ -22,6 +33,44 @@ from .agents import (
 )
 
 
+def _build_embeddings() -> CacheBackedEmbeddings:
+    """
+    Tạo embedding model với cache trên disk
+
+    Các câu hỏi FAQ lặp lại không cần chạy lại model - embedding được
+    đọc thẳng từ cache thay vì một forward pass mới.
+    """
+    # Giới hạn số threads của torch để không oversubscribe CPU khi chạy
+    # cùng nhiều Uvicorn workers
+    try:
+        import torch
+        torch.set_num_threads(min(4, os.cpu_count() or 1))
+    except ImportError:
+        pass
+
+    raw_embeddings = HuggingFaceEmbeddings(
+        model_name=model_config.embedding_model
+    )
+
+    # Dynamic int8 quantization cho các layer Linear: matmul int8 nhanh
+    # hơn fp32 đáng kể trên CPU và giảm một nửa RAM. Sai số lượng tử hoá
+    # đủ nhỏ để không ảnh hưởng thứ hạng ANN retrieval.
+    try:
+        import torch
+        raw_embeddings.client = torch.quantization.quantize_dynamic(
+            raw_embeddings.client, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    except Exception:
+        pass
+
+    return CacheBackedEmbeddings.from_bytes_store(
+        raw_embeddings,
+        LocalFileStore("./.emb_cache"),
+        namespace=model_config.embedding_model,
+        query_embedding_cache=True
+    )
+
+
 class AgenticRAG:
     """
     Agentic RAG System
@@ -42,6 +91,13 @@ class AgenticRAG:
         Args:
             vectorstore: Chroma vectorstore (nếu None, sẽ load từ config)
         """
+        # Logs chi tiết của agents đi qua logging ở mức DEBUG; verbose
+        # quyết định level (tắt verbose = bỏ qua cả khâu format chuỗi)
+        logging.basicConfig(format="%(message)s")
+        logging.getLogger("agentic_rag").setLevel(
+            logging.DEBUG if system_config.verbose else logging.WARNING
+        )
+
         # Initialize LLM
         self.llm = ChatOpenAI(
             model=model_config.chat_model,
@@ -52,10 +108,8 @@ class AgenticRAG:
         
         # Initialize or load vectorstore
         if vectorstore is None:
-            embeddings = HuggingFaceEmbeddings(
-                model_name=model_config.embedding_model
-            )
-            
+            embeddings = _build_embeddings()
+
             if os.path.exists(vectorstore_config.persist_directory):
                 self.vectorstore = Chroma(
                     persist_directory=vectorstore_config.persist_directory,
@@ -69,17 +123,41 @@ class AgenticRAG:
         
         # Initialize agents
         self.query_analyzer = QueryAnalyzerAgent(self.llm)
-        self.retrieval_planner = RetrievalPlannerAgent(self.llm)
         self.retrieval_agent = RetrievalAgent(self.vectorstore)
+        self.retrieval_planner = RetrievalPlannerAgent(
+            self.llm, search_tool=self.retrieval_agent.search_tool
+        )
         self.reasoning_agent = ReasoningAgent(self.llm)
         self.validation_agent = ValidationAgent(self.llm)
         self.formatter = ResponseFormatterAgent()
         
+        # Memory: nén lịch sử hội thoại dài trước khi đưa vào agents
+        self.memory = SummaryMemory()
+
+        # Semantic cache: trả lời ngay câu hỏi tương tự đã gặp (nếu bật caching)
+        self.semantic_cache = None
+        if system_config.enable_caching:
+            self.semantic_cache = SemanticCache(
+                client=self.vectorstore._client,
+                embeddings=self.vectorstore._embedding_function
+            )
+
         # Build workflow
         self.workflow = self._build_workflow()
-        
+
         print("✅ AgenticRAG initialized successfully")
-    
+
+    @staticmethod
+    def _cache_key(question: str) -> str:
+        """Chuẩn hóa câu hỏi trước khi tra semantic cache
+
+        Các biến thể từ lóng/viết tắt của cùng một câu hỏi ("đk tốt nghiệp"
+        vs "điều kiện tốt nghiệp") quy về cùng key, tăng tỷ lệ cache hit.
+        """
+        if _normalizer is not None:
+            return _normalizer.normalize(question)
+        return question
+
     def _build_workflow(self) -> StateGraph:
         """Xây dựng LangGraph workflow"""
         
@@ -130,7 +208,7 @@ class AgenticRAG:
     
     def _needs_retrieval(self, state: AgentState) -> Literal["retrieval", "direct"]:
         """Quyết định có cần retrieval hay trả lời trực tiếp"""
-        analysis = state.get("query_analysis", {})
+        analysis = state.query_analysis or {}
         needs_retrieval = analysis.get("needs_retrieval", True)
         
         if needs_retrieval:
@@ -140,22 +218,22 @@ class AgenticRAG:
     
     def _handle_direct_response(self, state: AgentState) -> AgentState:
         """Xử lý direct response (không cần retrieval)"""
-        analysis = state.get("query_analysis", {})
+        analysis = state.query_analysis or {}
         direct_response = analysis.get("direct_response", "")
         
-        state["final_answer"] = direct_response
-        state["confidence_score"] = 1.0
-        state["citations"] = []
-        state["current_step"] = "direct_response_completed"
+        state.final_answer = direct_response
+        state.confidence_score = 1.0
+        state.citations = []
+        state.current_step = "direct_response_completed"
         
         return state
 
     
     def _should_retry(self, state: AgentState) -> Literal["retry", "continue"]:
         """Quyết định có retry hay không"""
-        if state.get("needs_retry", False):
+        if state.needs_retry:
             # Tăng retry count
-            state["retry_count"] = state.get("retry_count", 0) + 1
+            state.retry_count += 1
             return "retry"
         return "continue"
     
@@ -179,26 +257,26 @@ class AgenticRAG:
             print(f"🤖 AGENTIC RAG PROCESSING")
             print(f"{'='*60}")
             print(f"Question: {question}")
-        
+
+        # Semantic cache lookup - bỏ qua workflow nếu đã gặp câu hỏi tương tự
+        cache_key = self._cache_key(question) if self.semantic_cache else question
+        if self.semantic_cache:
+            cached = self.semantic_cache.get(cache_key)
+            if cached:
+                if system_config.verbose:
+                    print("⚡ Semantic cache hit - skipping workflow")
+                return {
+                    "answer": cached["answer"],
+                    "confidence": cached["confidence"],
+                    "citations": cached["citations"],
+                    "metadata": {"cache_hit": True}
+                }
+
         # Initialize state
-        initial_state: AgentState = {
-            "original_query": question,
-            "conversation_history": conversation_history or [],
-            "query_analysis": None,
-            "reformulated_queries": [],
-            "retrieved_documents": [],
-            "retrieval_strategy": "",
-            "reasoning_steps": [],
-            "intermediate_answers": [],
-            "final_answer": "",
-            "confidence_score": 0.0,
-            "citations": [],
-            "validation_result": None,
-            "needs_retry": False,
-            "retry_count": 0,
-            "current_step": "initialized",
-            "error_message": None
-        }
+        initial_state = AgentState(
+            original_query=question,
+            conversation_history=self.memory.compact(conversation_history or [])
+        )
         
         try:
             # Run workflow với recursion limit cao hơn
@@ -212,6 +290,15 @@ class AgenticRAG:
                 print(f"✅ PROCESSING COMPLETE")
                 print(f"{'='*60}\n")
             
+            # Lưu kết quả vào semantic cache cho các câu hỏi tương tự sau này
+            if self.semantic_cache and final_state["final_answer"]:
+                self.semantic_cache.put(
+                    question=cache_key,
+                    answer=final_state["final_answer"],
+                    confidence=final_state["confidence_score"],
+                    citations=final_state["citations"]
+                )
+
             # Extract results
             return {
                 "answer": final_state["final_answer"],
@@ -222,7 +309,8 @@ class AgenticRAG:
                     "num_documents": len(final_state.get("retrieved_documents", [])),
                     "retrieval_strategy": final_state.get("retrieval_strategy"),
                     "retry_count": final_state.get("retry_count", 0),
-                    "validation": final_state.get("validation_result")
+                    "validation": final_state.get("validation_result"),
+                    "cache_hit": False
                 }
             }
             
@@ -239,6 +327,114 @@ class AgenticRAG:
                 }
             }
     
+    async def astream(
+        self,
+        question: str,
+        conversation_history: List[Dict[str, str]] = None,
+        result_holder: Dict[str, Any] = None
+    ):
+        """
+        Stream câu trả lời theo từng token (cho SSE / UI streaming)
+
+        Chạy analysis/planning/retrieval như bình thường, sau đó stream
+        trực tiếp output của reasoning LLM thay vì đợi toàn bộ workflow.
+
+        Args:
+            question: Câu hỏi
+            conversation_history: Lịch sử hội thoại (optional)
+            result_holder: Dict (optional) được điền confidence/citations/
+                           metadata sau khi stream xong - generator không
+                           return được giá trị nên dùng out-param
+
+        Yields:
+            Từng đoạn text của câu trả lời
+        """
+        # Semantic cache hit - trả toàn bộ câu trả lời ngay
+        cache_key = self._cache_key(question) if self.semantic_cache else question
+        if self.semantic_cache:
+            cached = await asyncio.to_thread(self.semantic_cache.get, cache_key)
+            if cached:
+                if result_holder is not None:
+                    result_holder["confidence"] = cached["confidence"]
+                    result_holder["citations"] = cached["citations"]
+                    result_holder["metadata"] = {"cache_hit": True, "num_documents": 0}
+                yield cached["answer"]
+                return
+
+        # compact có thể gọi LLM tóm tắt với history dài - đẩy ra thread
+        # như mọi blocking call khác để không chặn event loop
+        state = AgentState(
+            original_query=question,
+            conversation_history=await asyncio.to_thread(
+                self.memory.compact, conversation_history or []
+            )
+        )
+
+        try:
+            state = await asyncio.to_thread(self.query_analyzer.analyze, state)
+
+            # Greeting/chitchat - trả lời trực tiếp, không stream LLM
+            analysis = state.query_analysis or {}
+            if not analysis.get("needs_retrieval", True):
+                if result_holder is not None:
+                    result_holder["confidence"] = 1.0
+                    result_holder["citations"] = []
+                    result_holder["metadata"] = {"cache_hit": False, "num_documents": 0}
+                yield analysis.get("direct_response", "")
+                return
+
+            state = await asyncio.to_thread(self.retrieval_planner.plan, state)
+            state = await asyncio.to_thread(self.retrieval_agent.retrieve, state)
+
+            documents = state.retrieved_documents
+            if not documents:
+                if result_holder is not None:
+                    result_holder["confidence"] = 0.0
+                    result_holder["citations"] = []
+                    result_holder["metadata"] = {"cache_hit": False, "num_documents": 0}
+                yield "Xin lỗi, tôi không tìm thấy thông tin liên quan trong cơ sở dữ liệu."
+                return
+
+            # Stream reasoning LLM token-by-token
+            prompt = self.reasoning_agent.build_reasoning_prompt(question, documents)
+            answer_parts = []
+            async for chunk in self.llm.astream(prompt):
+                if chunk.content:
+                    answer_parts.append(chunk.content)
+                    yield chunk.content
+
+            # Citations ở cuối (giống ResponseFormatterAgent)
+            citations = self.reasoning_agent._extract_citations(documents)
+            answer = "".join(answer_parts)
+            if agent_config.require_citations and citations:
+                tail = f"\n\n---\n**Nguồn tham khảo:** {', '.join(citations)}"
+                answer += tail
+                yield tail
+
+            avg_similarity = sum(
+                doc.get("similarity_score", 0) for doc in documents[:3]
+            ) / min(3, len(documents))
+
+            if result_holder is not None:
+                result_holder["confidence"] = min(0.95, avg_similarity)
+                result_holder["citations"] = citations
+                result_holder["metadata"] = {
+                    "cache_hit": False,
+                    "num_documents": len(documents),
+                    "retrieval_strategy": state.retrieval_strategy,
+                    "retry_count": 0
+                }
+
+            # Lưu vào semantic cache cho lần sau
+            if self.semantic_cache and answer:
+                await asyncio.to_thread(
+                    self.semantic_cache.put,
+                    cache_key, answer, min(0.95, avg_similarity), citations
+                )
+
+        except Exception as e:
+            yield f"Xin lỗi, đã có lỗi xảy ra khi xử lý câu hỏi: {str(e)}"
+
     def chat(self, message: str, history: List[List[str]]) -> str:
         """
         Interface cho Gradio chatbot
@@ -285,9 +481,7 @@ def load_agentic_rag(vectorstore_path: str = None) -> AgenticRAG:
     """
     if vectorstore_path:
         # Load custom vectorstore
-        embeddings = HuggingFaceEmbeddings(
-            model_name=model_config.embedding_model
-        )
+        embeddings = _build_embeddings()
         vectorstore = Chroma(
             persist_directory=vectorstore_path,
             embedding_function=embeddings
@@ -3,7 +3,14 @@ Agents cho Agentic RAG System
 Định nghĩa các agents thực hiện các nhiệm vụ cụ thể
 """
 
-from typing import List, Dict, Any, Optional, TypedDict
+import functools
+import logging
+import random
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional
+import numpy as np
 from langchain_openai import ChatOpenAI
 from langchain_chroma import Chroma
 from .tools import (
@@ -15,38 +22,193 @@ from .tools import (
 )
 from .config import model_config, agent_config, system_config
 
+# Normalizer import 1 lần ở module scope thay vì try/except trong từng
+# QueryAnalyzerAgent.__init__
+try:
+    from .query_normalizer import normalizer as _normalizer
+except ImportError:
+    print("⚠️ Query normalizer not found, slang/abbreviation support disabled")
+    _normalizer = None
 
-class AgentState(TypedDict):
-    """State được share giữa các agents trong workflow"""
+# Logger thay cho các print() guarded bởi system_config.verbose - với
+# %-style args, chuỗi chỉ được format khi DEBUG level thực sự bật
+log = logging.getLogger("agentic_rag.agents")
+
+# Executor dùng chung cho các bước chạy song song (speculative retrieval, ...)
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="agentic_rag")
+
+# Số documents tối đa sau dedupe - resolve 1 lần lúc import thay vì
+# hasattr() check trong hot path (AgentConfig hiện không có top_k)
+_RETRIEVAL_TOP_K = getattr(agent_config, "top_k", 10)
+
+
+def _content_fingerprint(content: str) -> tuple:
+    """Fingerprint rẻ để dedupe documents
+
+    (độ dài, 64 ký tự đầu) phân biệt nhanh hầu hết chunks, nhưng các
+    chunks quy chế hay mở đầu bằng heading giống nhau ("Điều 15. ...") -
+    thêm hash() toàn chuỗi để 2 chunks khác nhau không bị gộp nhầm
+    (hash của str được CPython cache ngay trên object sau lần tính đầu).
+    """
+    return (len(content), content[:64], hash(content))
+
+
+def _compile_patterns(patterns: List[str]) -> "re.Pattern":
+    """Gộp danh sách patterns thành 1 compiled regex duy nhất
+
+    Thay vì N lần substring check Python-level mỗi query, chỉ cần 1 lần
+    scan C-level qua regex đã compile sẵn lúc import module.
+    """
+    return re.compile("|".join(
+        re.escape(p) for p in sorted(patterns, key=len, reverse=True)
+    ))
+
+
+# Pattern classification - build 1 lần lúc import. Từ đơn nằm trong
+# frozenset và test bằng phép giao tokens O(1)/từ; cụm nhiều từ vẫn cần
+# substring scan qua regex đã compile
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+_GREETING_WORDS = frozenset({"chào", "hello", "hi", "hey"})
+_GREETING_PHRASES_RE = _compile_patterns([
+    "xin chào", "chào bạn", "chào bot", "buổi sáng", "buổi chiều", "buổi tối"
+])
+
+_META_RE = _compile_patterns([
+    "tôi vừa hỏi", "câu hỏi trước", "bạn vừa nói",
+    "tôi hỏi gì", "tôi đã hỏi", "câu trước",
+    "what did i ask", "previous question"
+])
+
+_CHITCHAT_WORDS = frozenset({"thanks", "ok", "bye"})
+_CHITCHAT_PHRASES_RE = _compile_patterns([
+    "bạn là ai", "tên bạn là gì", "bạn làm được gì",
+    "who are you", "what's your name", "how are you",
+    "cảm ơn", "thank you", "tạm biệt"
+])
+
+_OUT_OF_DOMAIN_WORDS = frozenset({
+    "logarit", "vector", "lực", "vua", "phim",
+    "debug", "algorithm", "bệnh", "thuốc"
+})
+_OUT_OF_DOMAIN_PHRASES_RE = _compile_patterns([
+    # Toán học
+    "phương trình", "đạo hàm", "tích phân", "hình học", "đại số",
+    "lượng giác", "ma trận", "tổ hợp",
+    # Vật lý, hóa học
+    "gia tốc", "năng lượng", "nguyên tử", "phản ứng hóa học",
+    # Lịch sử, địa lý
+    "chiến tranh", "triều đại", "lãnh thổ", "đất nước",
+    # Thời tiết, ẩm thực
+    "thời tiết", "nấu ăn", "món ăn", "công thức nấu",
+    # Thể thao, giải trí
+    "bóng đá", "ca sĩ", "âm nhạc",
+    # Lập trình (nếu không liên quan đào tạo)
+    "code python", "lập trình java",
+    # Y tế
+    "triệu chứng", "điều trị"
+])
+
+_DOMAIN_WORDS = frozenset({"điểm", "thi", "điều", "chương", "gpa", "cpa", "haui"})
+_DOMAIN_PHRASES_RE = _compile_patterns([
+    "sinh viên", "học phần", "tín chỉ", "tốt nghiệp",
+    "đào tạo", "học kỳ", "chương trình", "quy chế",
+    "đăng ký", "rút bớt", "nghỉ học", "bảo lưu", "kỷ luật",
+    "đại học công nghiệp"
+])
+
+# Patterns cho các handler chitchat / meta-conversation
+_CHITCHAT_WHO_RE = _compile_patterns(["bạn là ai", "tên bạn"])
+
+# Câu trả lời chào hỏi tĩnh - hoisted ra module để không phải tạo lại
+# list strings trên mỗi lời chào
+_GREETINGS = (
+    "Xin chào! Tôi là trợ lý AI của Trường Đại học Công nghiệp Hà Nội. Tôi có thể giúp bạn tìm hiểu về quy chế đào tạo. Bạn có câu hỏi gì không?",
+    "Chào bạn! Tôi sẵn sàng hỗ trợ bạn về các vấn đề liên quan đến quy định đào tạo tại HaUI. Hãy đặt câu hỏi nhé!",
+    "Xin chào! Rất vui được hỗ trợ bạn. Tôi có thể trả lời các câu hỏi về quy chế đào tạo, điều kiện tốt nghiệp, và các quy định khác của trường. Bạn cần hỏi gì?"
+)
+_CHITCHAT_THANKS_RE = _compile_patterns(["cảm ơn", "thank"])
+_CHITCHAT_BYE_RE = _compile_patterns(["tạm biệt", "bye"])
+_ASK_ALL_QUESTIONS_RE = _compile_patterns([
+    "tất cả", "all", "toàn bộ", "những câu", "các câu",
+    "danh sách", "list", "lịch sử"
+])
+
+
+@functools.lru_cache(maxsize=1024)
+def _classify_cached(query_lower: str, token_count: int) -> str:
+    """Core phân loại query (pure function) - memoize kết quả
+
+    Các query giống hệt nhau (retry, user gửi lại) trả về ngay từ cache
+    mà không cần scan lại patterns.
+    """
+    tokens = frozenset(_WORD_RE.findall(query_lower))
+
+    # Greetings
+    if (tokens & _GREETING_WORDS or _GREETING_PHRASES_RE.search(query_lower)) \
+            and token_count <= 5:
+        return "greeting"
+
+    # Meta-conversation questions (về chính cuộc hội thoại)
+    if _META_RE.search(query_lower):
+        return "meta_conversation"
+
+    # Chitchat không liên quan tài liệu
+    if tokens & _CHITCHAT_WORDS or _CHITCHAT_PHRASES_RE.search(query_lower):
+        return "chitchat"
+
+    # OUT OF DOMAIN - Câu hỏi hoàn toàn không liên quan quy chế đào tạo
+    if tokens & _OUT_OF_DOMAIN_WORDS or _OUT_OF_DOMAIN_PHRASES_RE.search(query_lower):
+        return "out_of_domain"
+
+    # Nếu có từ khóa TRONG domain (quy chế đào tạo HaUI)
+    # -> chắc chắn là document_related
+    if tokens & _DOMAIN_WORDS or _DOMAIN_PHRASES_RE.search(query_lower):
+        return "document_related"
+
+    # Nếu không match gì cả, dùng LLM để kiểm tra (fallback)
+    # Tạm thời return document_related, nhưng có thể cải thiện sau
+    return "document_related"
+
+
+@dataclass(slots=True)
+class AgentState:
+    """State được share giữa các agents trong workflow
+
+    Slotted dataclass thay vì TypedDict: mỗi field đọc/ghi qua slot offset
+    cố định (C-level) thay vì dict lookup có hash string key, và tiết kiệm
+    bộ nhớ so với dict.
+    """
     # Input
-    original_query: str
-    conversation_history: List[Dict[str, str]]
+    original_query: str = ""
+    conversation_history: List[Dict[str, str]] = field(default_factory=list)
     
     # Query Analysis
-    query_analysis: Optional[Dict[str, Any]]
-    reformulated_queries: List[str]
+    query_analysis: Optional[Dict[str, Any]] = None
+    reformulated_queries: List[str] = field(default_factory=list)
     
     # Retrieval
-    retrieved_documents: List[Dict[str, Any]]
-    retrieval_strategy: str
+    retrieved_documents: List[Dict[str, Any]] = field(default_factory=list)
+    speculative_documents: List[Dict[str, Any]] = field(default_factory=list)
+    retrieval_strategy: str = ""
     
     # Reasoning
-    reasoning_steps: List[str]
-    intermediate_answers: List[str]
+    reasoning_steps: List[str] = field(default_factory=list)
+    intermediate_answers: List[str] = field(default_factory=list)
     
     # Response
-    final_answer: str
-    confidence_score: float
-    citations: List[str]
+    final_answer: str = ""
+    confidence_score: float = 0.0
+    citations: List[str] = field(default_factory=list)
     
     # Validation
-    validation_result: Optional[Dict[str, Any]]
-    needs_retry: bool
-    retry_count: int
+    validation_result: Optional[Dict[str, Any]] = None
+    needs_retry: bool = False
+    retry_count: int = 0
     
     # Metadata
-    current_step: str
-    error_message: Optional[str]
+    current_step: str = "initialized"
+    error_message: Optional[str] = None
 
 
 class QueryAnalyzerAgent:
@@ -58,46 +220,54 @@ class QueryAnalyzerAgent:
     def __init__(self, llm: ChatOpenAI):
         self.llm = llm
         self.analysis_tool = QueryAnalysisTool(llm)
+        self.reformulation_tool = QueryReformulationTool(llm)
         
-        # Import normalizer
-        try:
-            from .query_normalizer import normalizer
-            self.normalizer = normalizer
-        except ImportError:
-            print("⚠️ Query normalizer not found, slang/abbreviation support disabled")
-            self.normalizer = None
+        self.normalizer = _normalizer
+        
+        # Memo kết quả normalize - câu hỏi lặp lại (retry, FAQ) không cần
+        # chạy lại cả lượt slang-expansion
+        self._norm_cache: Dict[str, str] = {}
     
     def analyze(self, state: AgentState) -> AgentState:
         """Phân tích query và cập nhật state"""
-        query = state["original_query"].strip()
-        conversation_history = state.get("conversation_history", [])
+        query = state.original_query.strip()
+        conversation_history = state.conversation_history
         
         # NORMALIZE QUERY - Chuẩn hóa từ lóng và viết tắt
         original_query = query
         if self.normalizer:
-            query = self.normalizer.normalize(query)
+            normalized = self._norm_cache.get(query)
+            if normalized is None:
+                normalized = self.normalizer.normalize(query)
+                if len(self._norm_cache) >= 4096:
+                    self._norm_cache.clear()
+                self._norm_cache[query] = normalized
+            query = normalized
             
             # Log nếu có thay đổi
-            if query != original_query and system_config.verbose:
-                print(f"\n📝 [QueryNormalizer] Original: {original_query}")
-                print(f"✅ [QueryNormalizer] Normalized: {query}")
+            if query != original_query and log.isEnabledFor(logging.DEBUG):
+                log.debug("\n📝 [QueryNormalizer] Original: %s", original_query)
+                log.debug("✅ [QueryNormalizer] Normalized: %s", query)
                 explanations = self.normalizer.get_explanation(original_query)
                 if explanations:
-                    print(f"   Terms normalized: {dict(explanations)}")
+                    log.debug("   Terms normalized: %s", dict(explanations))
+        
+        log.debug("\n🔍 [QueryAnalyzer] Analyzing query: %s", query)
         
-        if system_config.verbose:
-            print(f"\n🔍 [QueryAnalyzer] Analyzing query: {query}")
+        # Tính lower/token_count đúng 1 lần - str.lower() trên tiếng Việt
+        # (multi-byte UTF-8) không rẻ, các handler bên dưới dùng lại
+        query_lower = query.lower()
+        token_count = len(query.split())
         
         # QUERY CLASSIFICATION - Phân loại query trước khi retrieval
-        query_type = self._classify_query(query, conversation_history)
+        query_type = self._classify_query(query_lower, token_count, conversation_history)
         
-        if system_config.verbose:
-            print(f"   Query type: {query_type}")
+        log.debug("   Query type: %s", query_type)
         
         # Xử lý theo loại query
         if query_type == "greeting":
             # Chào hỏi - không cần retrieval
-            state["query_analysis"] = {
+            state.query_analysis = {
                 "intent": "greeting",
                 "complexity": "simple",
                 "needs_retrieval": False,
@@ -105,120 +275,65 @@ class QueryAnalyzerAgent:
             }
         elif query_type == "meta_conversation":
             # Câu hỏi về chính cuộc hội thoại
-            state["query_analysis"] = {
+            state.query_analysis = {
                 "intent": "meta_conversation",
                 "complexity": "simple",
                 "needs_retrieval": False,
-                "direct_response": self._handle_meta_question(query, conversation_history)
+                "direct_response": self._handle_meta_question(query_lower, conversation_history)
             }
         elif query_type == "chitchat":
             # Chitchat không liên quan tài liệu
-            state["query_analysis"] = {
+            state.query_analysis = {
                 "intent": "chitchat",
                 "complexity": "simple",
                 "needs_retrieval": False,
-                "direct_response": self._handle_chitchat(query)
+                "direct_response": self._handle_chitchat(query_lower)
             }
         elif query_type == "out_of_domain":
             # Câu hỏi ngoài domain - từ chối lịch sự
-            state["query_analysis"] = {
+            state.query_analysis = {
                 "intent": "out_of_domain",
                 "complexity": "simple",
                 "needs_retrieval": False,
                 "direct_response": self._handle_out_of_domain(query)
             }
         else:
-            # Document-related query - tiến hành phân tích bình thường
+            # Document-related query - tiến hành phân tích bình thường.
+            # Speculative reformulation: reformulate không phụ thuộc kết quả
+            # analysis, nên chạy song song với analysis LLM call để 2 round
+            # trips chồng lên nhau thay vì nối tiếp
+            reformulation_future = None
+            if system_config.parallel_tool_execution and agent_config.enable_multi_query:
+                reformulation_future = _executor.submit(
+                    self.reformulation_tool.reformulate, query
+                )
+            
             analysis = self.analysis_tool.analyze(query)
             analysis["needs_retrieval"] = True
-            state["query_analysis"] = analysis
+            state.query_analysis = analysis
+            
+            if reformulation_future is not None:
+                try:
+                    state.reformulated_queries = reformulation_future.result()
+                except Exception:
+                    pass  # Planner sẽ tự reformulate lại nếu cần
             
-            if system_config.verbose:
-                print(f"   Intent: {analysis.get('intent', 'unknown')}")
-                print(f"   Complexity: {analysis.get('complexity', 'unknown')}")
-                print(f"   Key terms: {analysis.get('key_terms', [])}")
+            log.debug("   Intent: %s", analysis.get('intent', 'unknown'))
+            log.debug("   Complexity: %s", analysis.get('complexity', 'unknown'))
+            log.debug("   Key terms: %s", analysis.get('key_terms', []))
         
-        state["current_step"] = "query_analyzed"
+        state.current_step = "query_analyzed"
         return state
     
-    def _classify_query(self, query:str, history: List[Dict[str, str]]) -> str:
+    def _classify_query(self, query_lower: str, token_count: int, history: List[Dict[str, str]]) -> str:
         """Phân loại query: greeting, meta_conversation, chitchat, out_of_domain, document_related"""
-        query_lower = query.lower()
-        
-        # Greetings
-        greeting_patterns = [
-            "xin chào", "chào", "hello", "hi", "hey",
-            "chào bạn", "chào bot", "buổi sáng", "buổi chiều", "buổi tối"
-        ]
-        if any(pattern in query_lower for pattern in greeting_patterns) and len(query.split()) <= 5:
-            return "greeting"
-        
-        # Meta-conversation questions (về chính cuộc hội thoại)
-        meta_patterns = [
-            "tôi vừa hỏi", "câu hỏi trước", "bạn vừa nói",
-            "tôi hỏi gì", "tôi đã hỏi", "câu trước",
-            "what did i ask", "previous question"
-        ]
-        if any(pattern in query_lower for pattern in meta_patterns):
-            return "meta_conversation"
-        
-        # Chitchat không liên quan tài liệu
-        chitchat_patterns = [
-            "bạn là ai", "tên bạn là gì", "bạn làm được gì",
-            "who are you", "what's your name", "how are you",
-            "cảm ơn", "thank you", "thanks", "ok", "tạm biệt", "bye"
-        ]
-        if any(pattern in query_lower for pattern in chitchat_patterns):
-            return "chitchat"
-        
-        # OUT OF DOMAIN - Câu hỏi hoàn toàn không liên quan quy chế đào tạo
-        out_of_domain_patterns = [
-            # Toán học
-            "phương trình", "đạo hàm", "tích phân", "hình học", "đại số",
-            "logarit", "lượng giác", "ma trận", "vector", "tổ hợp",
-            # Vật lý, hóa học
-            "lực", "gia tốc", "năng lượng", "nguyên tử", "phản ứng hóa học",
-            # Lịch sử, địa lý
-            "chiến tranh", "vua", "triều đại", "lãnh thổ", "đất nước",
-            # Thời tiết, ẩm thực
-            "thời tiết", "nấu ăn", "món ăn", "công thức nấu",
-            # Thể thao, giải trí
-            "bóng đá", "ca sĩ", "phim", "âm nhạc",
-            # Lập trình (nếu không liên quan đào tạo)
-            "code python", "lập trình java", "debug", "algorithm",
-            # Y tế
-            "bệnh", "thuốc", "triệu chứng", "điều trị"
-        ]
-        if any(pattern in query_lower for pattern in out_of_domain_patterns):
-            return "out_of_domain"
-        
-        # Kiểm tra các từ khóa TRONG domain (quy chế đào tạo HaUI)
-        domain_keywords = [
-            "sinh viên", "học phần", "tín chỉ", "điểm", "thi", "tốt nghiệp",
-            "đào tạo", "học kỳ", "chương trình", "quy chế", "điều", "chương",
-            "đăng ký", "rút bớt", "nghỉ học", "bảo lưu", "kỷ luật",
-            "gpa", "cpa", "haui", "đại học công nghiệp"
-        ]
-        
-        # Nếu có từ khóa domain -> chắc chắn là document_related
-        if any(keyword in query_lower for keyword in domain_keywords):
-            return "document_related"
-        
-        # Nếu không match gì cả, dùng LLM để kiểm tra (fallback)
-        # Tạm thời return document_related, nhưng có thể cải thiện sau
-        return "document_related"
+        return _classify_cached(query_lower, token_count)
     
     def _handle_greeting(self, query: str) -> str:
         """Xử lý câu chào hỏi"""
-        greetings = [
-            "Xin chào! Tôi là trợ lý AI của Trường Đại học Công nghiệp Hà Nội. Tôi có thể giúp bạn tìm hiểu về quy chế đào tạo. Bạn có câu hỏi gì không?",
-            "Chào bạn! Tôi sẵn sàng hỗ trợ bạn về các vấn đề liên quan đến quy định đào tạo tại HaUI. Hãy đặt câu hỏi nhé!",
-            "Xin chào! Rất vui được hỗ trợ bạn. Tôi có thể trả lời các câu hỏi về quy chế đào tạo, điều kiện tốt nghiệp, và các quy định khác của trường. Bạn cần hỏi gì?"
-        ]
-        import random
-        return random.choice(greetings)
+        return _GREETINGS[random.randrange(len(_GREETINGS))]
     
-    def _handle_meta_question(self, query: str, history: List[Dict[str, str]]) -> str:
+    def _handle_meta_question(self, query_lower: str, history: List[Dict[str, str]]) -> str:
         """Xử lý câu hỏi về chính cuộc hội thoại"""
         if not history or len(history) < 2:
             return "Bạn chưa hỏi câu nào trước đó trong cuộc hội thoại này."
@@ -229,44 +344,38 @@ class QueryAnalyzerAgent:
         if not user_messages:
             return "Tôi không tìm thấy câu hỏi nào của bạn trong cuộc hội thoại này."
         
-        query_lower = query.lower()
-        
         # Phân biệt: hỏi TẤT CẢ vs chỉ câu TRƯỚC
-        all_questions_patterns = [
-            "tất cả", "all", "toàn bộ", "những câu", "các câu",
-            "danh sách", "list", "lịch sử"
-        ]
-        
-        ask_for_all = any(pattern in query_lower for pattern in all_questions_patterns)
+        ask_for_all = _ASK_ALL_QUESTIONS_RE.search(query_lower) is not None
         
         if ask_for_all and len(user_messages) > 1:
-            # Trả về TẤT CẢ câu hỏi
-            response = f"📝 Bạn đã hỏi tổng cộng {len(user_messages)} câu hỏi trong cuộc hội thoại này:\n\n"
-            
+            # Trả về TẤT CẢ câu hỏi - build bằng join thay vì += từng dòng
+            # (mỗi += tạo một str mới, O(N²) tổng số ký tự)
+            lines = []
             for idx, msg in enumerate(user_messages, 1):
                 question = msg.get("content", "")
                 # Giới hạn độ dài hiển thị
                 if len(question) > 80:
                     question = question[:77] + "..."
-                response += f"{idx}. {question}\n"
+                lines.append(f"{idx}. {question}")
             
-            response += "\nBạn muốn hỏi thêm về vấn đề nào không?"
-            return response
+            return (
+                f"📝 Bạn đã hỏi tổng cộng {len(user_messages)} câu hỏi trong cuộc hội thoại này:\n\n"
+                + "\n".join(lines)
+                + "\n\nBạn muốn hỏi thêm về vấn đề nào không?"
+            )
         else:
             # Chỉ trả về câu CUỐI CÙNG
             last_question = user_messages[-1].get("content", "")
             return f'Câu hỏi trước đó của bạn là: "{last_question}"\n\nBạn có muốn hỏi thêm về vấn đề này không?'
 
     
-    def _handle_chitchat(self, query: str) -> str:
+    def _handle_chitchat(self, query_lower: str) -> str:
         """Xử lý chitchat"""
-        query_lower = query.lower()
-        
-        if "bạn là ai" in query_lower or "tên bạn" in query_lower:
+        if _CHITCHAT_WHO_RE.search(query_lower):
             return "Tôi là trợ lý AI của Trường Đại học Công nghiệp Hà Nội, được thiết kế để hỗ trợ sinh viên và giảng viên về các quy định đào tạo. Tôi có thể giúp bạn tìm hiểu về quy chế đào tạo, điều kiện tốt nghiệp, và các quy định khác của trường."
-        elif "cảm ơn" in query_lower or "thank" in query_lower:
+        elif _CHITCHAT_THANKS_RE.search(query_lower):
             return "Rất vui được giúp đỡ bạn! Nếu có câu hỏi gì khác về quy chế đào tạo, đừng ngần ngại hỏi nhé. 😊"
-        elif "tạm biệt" in query_lower or "bye" in query_lower:
+        elif _CHITCHAT_BYE_RE.search(query_lower):
             return "Tạm biệt! Chúc bạn học tập tốt. Hẹn gặp lại! 👋"
         else:
             return "Tôi được thiết kế để trả lời các câu hỏi về quy chế đào tạo tại ĐH Công nghiệp Hà Nội. Bạn có câu hỏi gì về quy định đào tạo, điều kiện tốt nghiệp, hoặc các vấn đề học tập không?"
@@ -290,18 +399,30 @@ class RetrievalPlannerAgent:
     Nhiệm vụ: Quyết định chiến lược retrieval dựa trên query analysis
     """
     
-    def __init__(self, llm: ChatOpenAI):
+    def __init__(self, llm: ChatOpenAI, search_tool: Optional[VectorSearchTool] = None):
         self.llm = llm
         self.reformulation_tool = QueryReformulationTool(llm)
-    
+        self.search_tool = search_tool
+
     def plan(self, state: AgentState) -> AgentState:
         """Lập kế hoạch retrieval"""
-        query = state["original_query"]
-        analysis = state.get("query_analysis", {})
+        query = state.original_query
+        analysis = state.query_analysis or {}
         complexity = analysis.get("complexity", "medium")
         
-        if system_config.verbose:
-            print(f"\n📋 [RetrievalPlanner] Planning retrieval strategy...")
+        log.debug("\n📋 [RetrievalPlanner] Planning retrieval strategy...")
+
+        # Speculative retrieval: search ngay với câu hỏi gốc trong khi chờ
+        # LLM reformulate - giấu planner latency sau retrieval latency
+        speculative_future = None
+        if (agent_config.speculative_retrieval
+                and self.search_tool is not None
+                and complexity != "simple"):
+            speculative_future = _executor.submit(self.search_tool.search, query)
+
+        # Reformulations đã được analyzer chạy speculative song song với
+        # analysis LLM call (nếu bật parallel_tool_execution)
+        precomputed = state.reformulated_queries or None
         
         # Xác định strategy dựa trên complexity
         if complexity == "simple":
@@ -310,27 +431,39 @@ class RetrievalPlannerAgent:
         elif complexity == "medium":
             strategy = "multi_query"
             if agent_config.enable_multi_query:
-                queries = self.reformulation_tool.reformulate(query)
+                queries = precomputed or self.reformulation_tool.reformulate(query)
             else:
                 queries = [query]
         else:  # complex
             strategy = "multi_query_with_expansion"
             if agent_config.enable_multi_query:
-                queries = self.reformulation_tool.reformulate(query)
+                # Expansion không phụ thuộc reformulation - hai LLM call
+                # độc lập chạy song song thay vì nối tiếp
+                expand_future = None
                 if agent_config.enable_query_expansion:
-                    expanded = self.reformulation_tool.expand_query(query)
-                    queries.append(expanded)
+                    expand_future = _executor.submit(
+                        self.reformulation_tool.expand_query, query
+                    )
+                queries = list(precomputed) if precomputed else self.reformulation_tool.reformulate(query)
+                if expand_future is not None:
+                    queries.append(expand_future.result())
             else:
                 queries = [query]
         
-        if system_config.verbose:
-            print(f"   Strategy: {strategy}")
-            print(f"   Generated {len(queries)} queries")
+        log.debug("   Strategy: %s", strategy)
+        log.debug("   Generated %d queries", len(queries))
         
+        # Thu kết quả speculative search (đã chạy song song với LLM call)
+        if speculative_future is not None:
+            try:
+                state.speculative_documents = speculative_future.result()
+            except Exception:
+                state.speculative_documents = []
+
         # Cập nhật state
-        state["retrieval_strategy"] = strategy
-        state["reformulated_queries"] = queries
-        state["current_step"] = "retrieval_planned"
+        state.retrieval_strategy = strategy
+        state.reformulated_queries = queries
+        state.current_step = "retrieval_planned"
         
         return state
 
@@ -343,42 +476,84 @@ class RetrievalAgent:
     
     def __init__(self, vectorstore: Chroma):
         self.search_tool = VectorSearchTool(vectorstore)
-    
+
+        # Cache kết quả retrieval theo bộ queries - các reformulation giống
+        # nhau (retry, câu hỏi lặp lại) không cần chạy lại vector search
+        self._retrieval_cache: Dict[tuple, List[Dict[str, Any]]] = {}
+
     def retrieve(self, state: AgentState) -> AgentState:
         """Thực hiện retrieval"""
-        queries = state.get("reformulated_queries", [state["original_query"]])
-        
-        if system_config.verbose:
-            print(f"\n🔎 [Retrieval] Searching with {len(queries)} queries...")
-        
+        queries = state.reformulated_queries or [state.original_query]
+
+        # Reformulation/expansion hay sinh biến thể trùng nhau (nhất là sau
+        # normalize) - dedupe giữ thứ tự trước khi đụng vectorstore
+        queries = list(dict.fromkeys(queries))
+
+        log.debug("\n🔎 [Retrieval] Searching with %d queries...", len(queries))
+
+        # Cache hit: bộ queries này đã được search trước đó
+        cache_key = tuple(queries)
+        if system_config.enable_caching:
+            cached = self._retrieval_cache.get(cache_key)
+            if cached is not None:
+                log.debug("   ⚡ Retrieval cache hit (%d documents)", len(cached))
+                state.retrieved_documents = cached
+                state.current_step = "documents_retrieved"
+                return state
+
         all_documents = []
         seen_contents = set()  # Để tránh duplicate
-        
-        for query in queries:
-            results = self.search_tool.search(query)
-            
+
+        # Bắt đầu từ speculative documents (đã search song song với planner)
+        for doc in state.speculative_documents:
+            fingerprint = _content_fingerprint(doc["content"])
+            if fingerprint not in seen_contents:
+                seen_contents.add(fingerprint)
+                all_documents.append(doc)
+
+        # Batch search: embed tất cả queries một lượt và query Chroma một
+        # lần duy nhất thay vì N round trips riêng lẻ
+        results_per_query = self.search_tool.batch_search(queries)
+
+        for results in results_per_query:
             for doc in results:
                 # Chỉ thêm nếu chưa có (dựa vào content)
-                content_hash = hash(doc["content"])
-                if content_hash not in seen_contents:
-                    seen_contents.add(content_hash)
+                fingerprint = _content_fingerprint(doc["content"])
+                if fingerprint not in seen_contents:
+                    seen_contents.add(fingerprint)
                     all_documents.append(doc)
         
-        # Sắp xếp theo similarity score
-        all_documents.sort(key=lambda x: x.get("similarity_score", 0), reverse=True)
-        
-        # Giới hạn số lượng
-        top_documents = all_documents[:agent_config.top_k if hasattr(agent_config, 'top_k') else 10]
-        
-        if system_config.verbose:
-            print(f"   Retrieved {len(top_documents)} unique documents")
-            if top_documents:
-                print(f"   Top similarity: {top_documents[0].get('similarity_score', 0):.3f}")
-        
+        # Lấy top-k theo similarity score: argpartition O(N) + sort k phần
+        # tử, thay vì sort toàn bộ trong Python
+        if len(all_documents) > _RETRIEVAL_TOP_K:
+            scores = np.fromiter(
+                (d.get("similarity_score", 0) for d in all_documents),
+                dtype=np.float32,
+                count=len(all_documents)
+            )
+            idx = np.argpartition(-scores, _RETRIEVAL_TOP_K)[:_RETRIEVAL_TOP_K]
+            top_documents = [all_documents[i] for i in idx[np.argsort(-scores[idx])]]
+        else:
+            top_documents = sorted(
+                all_documents,
+                key=lambda x: x.get("similarity_score", 0),
+                reverse=True
+            )
+        
+        log.debug("   Retrieved %d unique documents", len(top_documents))
+        if top_documents:
+            log.debug("   Top similarity: %.3f", top_documents[0].get('similarity_score', 0))
+        
+        if system_config.enable_caching:
+            self._retrieval_cache[cache_key] = top_documents
+            # Size cap đơn giản để cache không phình vô hạn
+            if len(self._retrieval_cache) > 256:
+                self._retrieval_cache.pop(next(iter(self._retrieval_cache)))
+
         # Cập nhật state
-        state["retrieved_documents"] = top_documents
-        state["current_step"] = "documents_retrieved"
-        
+        state.retrieved_documents = top_documents
+        state.current_step = "documents_retrieved"
+
         return state
 
 
@@ -394,55 +569,78 @@ class ReasoningAgent:
     
     def reason(self, state: AgentState) -> AgentState:
         """Thực hiện reasoning"""
-        query = state["original_query"]
-        documents = state.get("retrieved_documents", [])
-        analysis = state.get("query_analysis", {})
+        query = state.original_query
+        documents = state.retrieved_documents
+        analysis = state.query_analysis or {}
         
-        if system_config.verbose:
-            print(f"\n🧠 [Reasoning] Processing {len(documents)} documents...")
+        log.debug("\n🧠 [Reasoning] Processing %d documents...", len(documents))
         
         if not documents:
-            state["final_answer"] = "Xin lỗi, tôi không tìm thấy thông tin liên quan trong cơ sở dữ liệu."
-            state["confidence_score"] = 0.0
-            state["current_step"] = "reasoning_completed"
+            state.final_answer = "Xin lỗi, tôi không tìm thấy thông tin liên quan trong cơ sở dữ liệu."
+            state.confidence_score = 0.0
+            state.current_step = "reasoning_completed"
             return state
         
-        # Chain of Thought reasoning nếu câu hỏi phức tạp
+        # Build context 1 lần duy nhất - CoT mode dùng lại cho mọi câu hỏi
+        # con thay vì join lại chuỗi context cho từng sub-question
+        context = self._format_context(documents)
+        
+        # Chain of Thought reasoning nếu câu hỏi phức tạp. Với direct
+        # reasoning, đẩy LLM call lên executor rồi làm bookkeeping
+        # (citations, confidence) song song trong lúc chờ network
         if agent_config.enable_chain_of_thought and analysis.get("complexity") == "complex":
-            answer = self._chain_of_thought_reasoning(query, documents, analysis)
+            answer_future = None
+            answer = self._chain_of_thought_reasoning(query, context, analysis)
         else:
-            answer = self._direct_reasoning(query, documents)
+            answer_future = _executor.submit(self._direct_reasoning, query, context)
+            answer = None
         
         # Trích xuất citations
         citations = self._extract_citations(documents)
         
         # Tính confidence score dựa trên similarity scores
         if documents:
-            avg_similarity = sum(doc.get("similarity_score", 0) for doc in documents[:3]) / min(3, len(documents))
-            confidence = min(0.95, avg_similarity)
+            scores = np.fromiter(
+                (doc.get("similarity_score", 0) for doc in documents[:3]),
+                dtype=np.float32
+            )
+            confidence = float(min(0.95, scores.mean()))
         else:
             confidence = 0.0
         
-        if system_config.verbose:
-            print(f"   Confidence: {confidence:.2f}")
+        if answer_future is not None:
+            answer = answer_future.result()
+        
+        log.debug("   Confidence: %.2f", confidence)
         
         # Cập nhật state
-        state["final_answer"] = answer
-        state["confidence_score"] = confidence
-        state["citations"] = citations
-        state["current_step"] = "reasoning_completed"
+        state.final_answer = answer
+        state.confidence_score = confidence
+        state.citations = citations
+        state.current_step = "reasoning_completed"
         
         return state
     
-    def _direct_reasoning(self, query: str, documents: List[Dict[str, Any]]) -> str:
-        """Reasoning trực tiếp từ documents"""
-        # Tạo context
-        context = "\n\n---\n\n".join([
-            f"[Nguồn: {doc.get('doc_type', 'Unknown')}]\n{doc['content']}" 
-            for doc in documents[:5]
+    def _format_context(self, documents: List[Dict[str, Any]]) -> str:
+        """Build context string từ documents (chỉ gọi 1 lần mỗi request)"""
+        # Sắp xếp chunks theo thứ tự deterministic để các câu hỏi trùng
+        # documents tạo ra prompt prefix giống hệt nhau, tận dụng prompt
+        # caching phía provider
+        context_docs = sorted(
+            documents[:5],
+            key=lambda d: (d.get("doc_type", ""), d.get("content", ""))
+        )
+        return "\n\n---\n\n".join([
+            f"[Nguồn: {doc.get('doc_type', 'Unknown')}]\n{doc['content']}"
+            for doc in context_docs
         ])
-        
-        prompt = f"""{system_config.system_role}
+
+    def build_reasoning_prompt(self, query: str, documents: List[Dict[str, Any]], context: Optional[str] = None) -> str:
+        """Tạo prompt reasoning từ query và documents (dùng chung cho streaming)"""
+        if context is None:
+            context = self._format_context(documents)
+
+        return f"""{system_config.system_role}
 
 Dựa vào các tài liệu sau, hãy trả lời câu hỏi một cách chính xác và đầy đủ.
 
@@ -458,36 +656,44 @@ YÊU CẦU:
 4. Nếu không chắc chắn, nói rõ
 
 TRẢ LỜI:"""
-        
+
+    def _direct_reasoning(self, query: str, context: str) -> str:
+        """Reasoning trực tiếp từ context đã build sẵn"""
+        prompt = self.build_reasoning_prompt(query, [], context=context)
         response = self.llm.invoke(prompt)
         return response.content.strip()
     
-    def _chain_of_thought_reasoning(self, query: str, documents: List[Dict[str, Any]], analysis: Dict) -> str:
+    def _chain_of_thought_reasoning(self, query: str, context: str, analysis: Dict) -> str:
         """Chain of Thought reasoning cho câu hỏi phức tạp"""
         sub_questions = analysis.get("sub_questions", [])
         
         if not sub_questions:
-            return self._direct_reasoning(query, documents)
-        
-        # Trả lời từng câu hỏi con
-        intermediate_answers = []
-        
-        for i, sub_q in enumerate(sub_questions, 1):
-            if system_config.verbose:
-                print(f"   Sub-question {i}: {sub_q}")
-            
-            answer = self._direct_reasoning(sub_q, documents)
-            intermediate_answers.append(f"**Câu hỏi {i}:** {sub_q}\n**Trả lời:** {answer}")
+            return self._direct_reasoning(query, context)
+        
+        if log.isEnabledFor(logging.DEBUG):
+            for i, sub_q in enumerate(sub_questions, 1):
+                log.debug("   Sub-question %d: %s", i, sub_q)
+        
+        # Trả lời các câu hỏi con SONG SONG - chúng độc lập với nhau, chỉ
+        # bước tổng hợp cuối cần đủ tất cả. Wall time ≈ 1 LLM call thay vì N
+        answers = list(_executor.map(
+            lambda sub_q: self._direct_reasoning(sub_q, context),
+            sub_questions
+        ))
+        intermediate_answers = [
+            f"**Câu hỏi {i}:** {sub_q}\n**Trả lời:** {answer}"
+            for i, (sub_q, answer) in enumerate(zip(sub_questions, answers), 1)
+        ]
         
         # Tổng hợp câu trả lời
-        context = "\n\n".join(intermediate_answers)
+        sub_answers_block = "\n\n".join(intermediate_answers)
         
         synthesis_prompt = f"""Dựa vào các câu trả lời cho các câu hỏi con, hãy tổng hợp thành một câu trả lời hoàn chỉnh cho câu hỏi gốc.
 
 CÂU HỎI GỐC: {query}
 
 CÁC CÂU TRẢ LỜI CON:
-{context}
+{sub_answers_block}
 
 Hãy tổng hợp thành câu trả lời mạch lạc, đầy đủ và dễ hiểu."""
         
@@ -495,12 +701,12 @@ Hãy tổng hợp thành câu trả lời mạch lạc, đầy đủ và dễ hi
         return response.content.strip()
     
     def _extract_citations(self, documents: List[Dict[str, Any]]) -> List[str]:
-        """Trích xuất citations từ documents"""
-        citations = []
-        for doc in documents[:3]:  # Top 3 documents
-            source = doc.get("doc_type", "Unknown")
-            citations.append(source)
-        return list(set(citations))  # Remove duplicates
+        """Trích xuất citations từ documents (giữ thứ tự theo similarity)"""
+        # dict.fromkeys dedupe nhưng giữ insertion order - citation đầu
+        # tiên luôn là document giống câu hỏi nhất
+        return list(dict.fromkeys(
+            doc.get("doc_type", "Unknown") for doc in documents[:3]
+        ))
 
 
 class ValidationAgent:
@@ -516,18 +722,32 @@ class ValidationAgent:
     def validate(self, state: AgentState) -> AgentState:
         """Validate câu trả lời"""
         if not agent_config.enable_answer_validation:
-            state["validation_result"] = {"is_valid": True, "confidence": 1.0}
-            state["needs_retry"] = False
-            state["current_step"] = "validation_completed"
+            state.validation_result = {"is_valid": True, "confidence": 1.0}
+            state.needs_retry = False
+            state.current_step = "validation_completed"
             return state
         
-        query = state["original_query"]
-        answer = state.get("final_answer", "")
-        documents = state.get("retrieved_documents", [])
-        confidence = state.get("confidence_score", 0.0)
+        query = state.original_query
+        answer = state.final_answer
+        documents = state.retrieved_documents
+        confidence = state.confidence_score
+        
+        # Bind các config đọc nhiều lần vào locals (LOAD_FAST thay vì
+        # LOAD_GLOBAL + LOAD_ATTR mỗi lần)
+        min_conf = agent_config.min_confidence_score
+        
+        # Short-circuit: confidence đã vượt ngưỡng một khoảng an toàn và
+        # đủ documents - LLM validation hiếm khi lật kết quả, bỏ qua để
+        # tiết kiệm 1 round trip
+        skip_threshold = min_conf + agent_config.skip_validation_margin
+        if confidence >= skip_threshold and len(documents) >= 3:
+            log.debug("\n✓ [Validation] Confidence %.2f ≥ %.2f, skipping LLM validation", confidence, skip_threshold)
+            state.validation_result = {"is_valid": True, "confidence": confidence}
+            state.needs_retry = False
+            state.current_step = "validation_completed"
+            return state
         
-        if system_config.verbose:
-            print(f"\n✓ [Validation] Validating answer...")
+        log.debug("\n✓ [Validation] Validating answer...")
         
         # Validate
         validation_result = self.validation_tool.validate(query, answer, documents)
@@ -538,19 +758,18 @@ class ValidationAgent:
         # Quyết định có cần retry không
         needs_retry = (
             not is_valid or 
-            val_confidence < agent_config.min_confidence_score or
-            confidence < agent_config.min_confidence_score
-        ) and state.get("retry_count", 0) < agent_config.max_retries
+            val_confidence < min_conf or
+            confidence < min_conf
+        ) and state.retry_count < agent_config.max_retries
         
-        if system_config.verbose:
-            print(f"   Valid: {is_valid}, Confidence: {val_confidence:.2f}")
-            if needs_retry:
-                print(f"   ⚠️ Needs retry (attempt {state.get('retry_count', 0) + 1}/{agent_config.max_retries})")
+        log.debug("   Valid: %s, Confidence: %.2f", is_valid, val_confidence)
+        if needs_retry:
+            log.debug("   ⚠️ Needs retry (attempt %d/%d)", state.retry_count + 1, agent_config.max_retries)
         
         # Cập nhật state
-        state["validation_result"] = validation_result
-        state["needs_retry"] = needs_retry
-        state["current_step"] = "validation_completed"
+        state.validation_result = validation_result
+        state.needs_retry = needs_retry
+        state.current_step = "validation_completed"
         
         return state
 
@@ -563,25 +782,25 @@ class ResponseFormatterAgent:
     
     def format(self, state: AgentState) -> AgentState:
         """Format câu trả lời"""
-        answer = state.get("final_answer", "")
-        citations = state.get("citations", [])
-        confidence = state.get("confidence_score", 0.0)
+        answer = state.final_answer
+        citations = state.citations
+        confidence = state.confidence_score
+        
+        log.debug("\n📝 [Formatter] Formatting final response...")
         
-        if system_config.verbose:
-            print(f"\n📝 [Formatter] Formatting final response...")
+        # Gom các phần rồi join 1 lần thay vì nối chuỗi nhiều bước
+        parts = [answer]
         
         # Format với citations nếu được yêu cầu
         if agent_config.require_citations and citations:
-            formatted_answer = f"{answer}\n\n---\n**Nguồn tham khảo:** {', '.join(citations)}"
-        else:
-            formatted_answer = answer
+            parts.append(f"\n\n---\n**Nguồn tham khảo:** {', '.join(citations)}")
         
-        # Thêm confidence warning nếu thấp
-        if confidence < 0.7:
-            formatted_answer += f"\n\n*Lưu ý: Độ tin cậy của câu trả lời này là {confidence:.0%}. Vui lòng kiểm tra lại hoặc hỏi cụ thể hơn.*"
+        # Thêm confidence warning nếu thấp (ngưỡng theo thang 1/(1+d))
+        if confidence < agent_config.low_confidence_warning:
+            parts.append(f"\n\n*Lưu ý: Độ tin cậy của câu trả lời này là {confidence:.0%}. Vui lòng kiểm tra lại hoặc hỏi cụ thể hơn.*")
         
-        state["final_answer"] = formatted_answer
-        state["current_step"] = "response_formatted"
+        state.final_answer = "".join(parts) if len(parts) > 1 else answer
+        state.current_step = "response_formatted"
         
         return state
 
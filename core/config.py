@@ -11,7 +11,7 @@ from typing import Optional
 # Load environment variables
 load_dotenv()
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ModelConfig:
     """Cấu hình cho các mô hình AI"""
     # OpenAI models
@@ -27,7 +27,7 @@ class ModelConfig:
     openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class VectorStoreConfig:
     """Cấu hình cho vector database"""
     persist_directory: str = "vector_db"
@@ -42,7 +42,7 @@ class VectorStoreConfig:
     chunk_overlap: int = 100
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class AgentConfig:
     """Cấu hình cho Agents"""
     # Query Analysis
@@ -52,6 +52,7 @@ class AgentConfig:
     # Retrieval Planning
     enable_multi_query: bool = True  # Tạo nhiều queries từ 1 query
     enable_query_expansion: bool = True  # Mở rộng query với từ đồng nghĩa
+    speculative_retrieval: bool = True  # Search song song với planning LLM call
     
     # Reasoning
     enable_chain_of_thought: bool = True  # Suy luận từng bước
@@ -60,14 +61,19 @@ class AgentConfig:
     
     # Response Generation
     require_citations: bool = True  # Yêu cầu trích dẫn nguồn
-    min_confidence_score: float = 0.5  # Lowered from 0.6 để giảm retry
+    # Calibrate theo thang similarity 1/(1+d): match tốt của MiniLM trên
+    # tiếng Việt rơi vào ~0.55-0.65, match kém dưới ~0.45
+    min_confidence_score: float = 0.45
+    # Caveat "độ tin cậy thấp" trong câu trả lời khi confidence dưới mức này
+    low_confidence_warning: float = 0.55
     
     # Validation
     enable_answer_validation: bool = True
+    skip_validation_margin: float = 0.1  # Confidence vượt ngưỡng chừng này thì bỏ qua LLM validation
     max_retries: int = 1  # Giảm từ 2 xuống 1 để tránh loop
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class SystemConfig:
     """Cấu hình tổng thể của hệ thống"""
     # System prompt
@@ -86,10 +92,10 @@ Bạn cần:
     
     # Performance
     enable_caching: bool = True  # Cache kết quả retrieval
-    parallel_tool_execution: bool = False  # Chạy tools song song (experimental)
+    parallel_tool_execution: bool = True  # Chạy tools song song (speculative reformulation, ...)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class MongoDBConfig:
     """Cấu hình cho MongoDB"""
     uri: str = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
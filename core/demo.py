@@ -3,11 +3,22 @@ Demo Agentic RAG System
 Tạo giao diện Gradio để test và demo hệ thống
 """
 
+import asyncio
 import gradio as gr
 from core.agentic_rag import AgenticRAG, load_agentic_rag
 from core.config import system_config
 import os
 
+# Templates build sẵn ở module scope - respond chỉ .format() thay vì
+# dựng lại chuỗi nhiều dòng trên mỗi request
+_STATS_TMPL = "Câu hỏi cuối: ✓\nĐộ tin cậy: {confidence:.0%}\nDocuments: {num_docs}"
+_DBG_TMPL = (
+    "\n\n---\n*Debug Info:*"
+    "\n- Documents retrieved: {num_documents}"
+    "\n- Strategy: {retrieval_strategy}"
+    "\n- Retries: {retry_count}"
+)
+
 
 def create_demo_interface():
     """Tạo Gradio interface cho Agentic RAG"""
@@ -18,7 +29,18 @@ def create_demo_interface():
     
     # Print config
     agentic_rag.print_config()
-    
+
+    # Pre-warm như backend: 1 similarity search chạm embedding model +
+    # Chroma HNSW, 1 ping mở TLS session với OpenAI. Không chạy cả
+    # workflow (4-5 LLM calls) và không ghi gì vào semantic cache
+    try:
+        print("🔥 Warming up pipeline...")
+        agentic_rag.vectorstore.similarity_search("warmup", 1)
+        agentic_rag.llm.invoke("ping")
+        print("✅ Warmup complete (embeddings, vectorstore, LLM)")
+    except Exception as e:
+        print(f"⚠️ Warmup failed (continuing anyway): {e}")
+
     # Tạo interface
     with gr.Blocks(title="Agentic RAG - HaUI Regulations") as demo:
         # Header
@@ -60,7 +82,8 @@ def create_demo_interface():
                 chatbot = gr.Chatbot(
                     label="💬 Chat với Agentic RAG",
                     height=500,
-                    show_label=True
+                    show_label=True,
+                    type="messages"
                 )
                 
                 with gr.Row():
@@ -122,41 +145,53 @@ def create_demo_interface():
             )
         
         # Functions
-        def respond(message, chat_history):
-            """Xử lý câu hỏi và trả lời"""
-            # Update verbose setting
-            system_config.verbose = verbose_checkbox.value
-            
-            # Get response from agentic RAG
-            result = agentic_rag.query(message)
-            
-            bot_message = result["answer"]
-            
-            # Thêm thông tin metadata nếu verbose
-            if verbose_checkbox.value:
-                metadata = result.get("metadata", {})
-                bot_message += f"\n\n---\n*Debug Info:*"
-                bot_message += f"\n- Documents retrieved: {metadata.get('num_documents', 0)}"
-                bot_message += f"\n- Strategy: {metadata.get('retrieval_strategy', 'N/A')}"
-                bot_message += f"\n- Retries: {metadata.get('retry_count', 0)}"
+        async def respond(message, chat_history, verbose):
+            """Xử lý câu hỏi và stream câu trả lời theo từng token
+
+            Generator function: Gradio render từng partial history, user
+            thấy chữ đầu tiên ngay khi LLM bắt đầu decode thay vì đợi cả
+            pipeline chạy xong.
+
+            verbose là giá trị checkbox của riêng request này (Gradio
+            truyền qua inputs) - không đụng vào global system_config nên
+            nhiều user bật/tắt debug không can thiệp lẫn nhau.
+            """
             
-            # Gradio internally expects messages format
-            # Always append as message dictionaries
+            # Gradio messages format: thêm user message + assistant rỗng
             chat_history = chat_history + [
                 {"role": "user", "content": message},
-                {"role": "assistant", "content": bot_message}
+                {"role": "assistant", "content": ""}
             ]
             
+            # Stream từng chunk, astream điền result_holder khi xong
+            result_holder = {}
+            parts = []
+            async for chunk in agentic_rag.astream(message, result_holder=result_holder):
+                parts.append(chunk)
+                chat_history[-1]["content"] = "".join(parts)
+                yield "", chat_history, "Đang trả lời..."
+                # Nhường event loop để render/request khác chen vào
+                await asyncio.sleep(0)
+            
+            bot_message = "".join(parts)
+            metadata = result_holder.get("metadata", {})
+            
+            # Thêm thông tin metadata nếu verbose
+            if verbose:
+                bot_message += _DBG_TMPL.format(
+                    num_documents=metadata.get("num_documents", 0),
+                    retrieval_strategy=metadata.get("retrieval_strategy", "N/A"),
+                    retry_count=metadata.get("retry_count", 0)
+                )
+                chat_history[-1]["content"] = bot_message
+            
             # Update stats
-            confidence = result.get("confidence", 0.0)
-            num_docs = result.get("metadata", {}).get("num_documents", 0)
-            stats = f"""
-Câu hỏi cuối: ✓
-Độ tin cậy: {confidence:.0%}
-Documents: {num_docs}
-            """.strip()
+            stats = _STATS_TMPL.format(
+                confidence=result_holder.get("confidence", 0.0),
+                num_docs=metadata.get("num_documents", 0)
+            )
             
-            return "", chat_history, stats
+            yield "", chat_history, stats
         
         def clear_history():
             """Xóa lịch sử chat"""
@@ -165,13 +200,13 @@ Documents: {num_docs}
         # Event handlers
         submit_btn.click(
             respond,
-            inputs=[msg, chatbot],
+            inputs=[msg, chatbot, verbose_checkbox],
             outputs=[msg, chatbot, stats_text]
         )
         
         msg.submit(
             respond,
-            inputs=[msg, chatbot],
+            inputs=[msg, chatbot, verbose_checkbox],
             outputs=[msg, chatbot, stats_text]
         )
         
@@ -179,11 +214,6 @@ Documents: {num_docs}
             clear_history,
             outputs=[chatbot, stats_text]
         )
-        
-        verbose_checkbox.change(
-            lambda x: system_config.__setattr__("verbose", x),
-            inputs=[verbose_checkbox]
-        )
     
     return demo
 
@@ -197,6 +227,10 @@ if __name__ == "__main__":
     try:
         demo = create_demo_interface()
         
+        # Cho phép nhiều request chạy xen kẽ trên event loop - không còn
+        # user sau phải đợi user trước xong mới được xử lý
+        demo.queue(default_concurrency_limit=16)
+        
         # Launch - let Gradio find available port automatically
         demo.launch(
             share=False,  # Set to True to create public link
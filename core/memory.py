@@ -0,0 +1,131 @@
+"""
+Conversation Memory cho Agentic RAG System
+Nén lịch sử hội thoại dài thành summary để giảm prompt tokens
+"""
+
+from typing import Dict, List
+
+from langchain_openai import ChatOpenAI
+
+from .config import model_config
+
+
+class SummaryMemory:
+    """
+    Rolling-summary memory cho conversation history
+
+    Giữ nguyên K lượt hội thoại gần nhất, các lượt cũ hơn được nén thành
+    một đoạn summary duy nhất bằng LLM. Prompt tokens không còn tăng
+    tuyến tính theo độ dài hội thoại.
+    """
+
+    def __init__(self, window_size: int = 6, summarise_every: int = 10):
+        """
+        Khởi tạo SummaryMemory
+
+        Args:
+            window_size: Số messages gần nhất giữ nguyên văn
+            summarise_every: Chỉ tóm tắt khi phần cũ vượt quá ngưỡng này
+        """
+        self.window_size = window_size
+        self.summarise_every = summarise_every
+
+        # LLM rẻ, deterministic cho việc tóm tắt
+        self.llm = ChatOpenAI(
+            model="gpt-4o-mini",
+            temperature=0,
+            max_tokens=300,
+            api_key=model_config.openai_api_key
+        )
+
+        # Trạng thái tóm tắt incremental theo hội thoại: message đầu tiên
+        # định danh hội thoại, mỗi lượt chỉ fold phần vừa rơi ra khỏi
+        # window vào summary cũ thay vì tóm tắt lại cả transcript
+        self._summary_state: Dict[tuple, tuple] = {}
+        self._summary_state_size = 256
+
+    def compact(self, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        Nén history: summary cho phần cũ + giữ nguyên các lượt gần nhất
+
+        Args:
+            history: Lịch sử hội thoại đầy đủ
+
+        Returns:
+            History đã nén (hoặc nguyên bản nếu còn ngắn)
+        """
+        if len(history) <= self.window_size + self.summarise_every:
+            return history
+
+        cut = len(history) - self.window_size
+        older, recent = history[:cut], history[cut:]
+
+        summary = self._summarise(older)
+        return [{"role": "system", "content": f"[Tóm tắt hội thoại] {summary}"}] + recent
+
+    @staticmethod
+    def _fingerprint(message: Dict[str, str]) -> tuple:
+        """Định danh 1 message để kiểm tra prefix có khớp state đã lưu"""
+        return (message.get("role", ""), message.get("content", ""))
+
+    def _summarise(self, messages: List[Dict[str, str]]) -> str:
+        """Tóm tắt phần cũ của hội thoại (incremental theo summary trước)"""
+        # Hội thoại được định danh bằng message đầu tiên - ổn định qua
+        # các lượt chat của cùng một session
+        conv_key = self._fingerprint(messages[0])
+        prev_n, prev_fp, prev_summary = self._summary_state.get(conv_key, (0, None, ""))
+
+        # Prefix không đổi so với lượt trước -> dùng lại, không gọi LLM
+        if prev_n == len(messages) and self._fingerprint(messages[-1]) == prev_fp:
+            return prev_summary
+
+        # Fold: chỉ đưa summary cũ + các lượt mới rơi ra khỏi window vào
+        # prompt thay vì chạy lại cả transcript ngày càng dài
+        incremental = (
+            0 < prev_n < len(messages)
+            and self._fingerprint(messages[prev_n - 1]) == prev_fp
+        )
+        new_messages = messages[prev_n:] if incremental else messages
+        transcript = "\n".join(
+            f"{msg.get('role', 'user')}: {msg.get('content', '')}" for msg in new_messages
+        )
+
+        if incremental:
+            prompt = f"""Cập nhật tóm tắt cuộc hội thoại giữa sinh viên và trợ lý tư vấn quy chế đào tạo.
+Gộp tóm tắt cũ với các lượt hội thoại mới thành một tóm tắt duy nhất.
+Giữ lại các câu hỏi chính và thông tin quan trọng đã được trả lời.
+
+TÓM TẮT CŨ:
+{prev_summary}
+
+HỘI THOẠI MỚI:
+{transcript}
+
+Tóm tắt (tối đa 5 câu):"""
+        else:
+            prompt = f"""Tóm tắt ngắn gọn cuộc hội thoại sau giữa sinh viên và trợ lý tư vấn quy chế đào tạo.
+Giữ lại các câu hỏi chính và thông tin quan trọng đã được trả lời.
+
+HỘI THOẠI:
+{transcript}
+
+Tóm tắt (tối đa 5 câu):"""
+
+        try:
+            response = self.llm.invoke(prompt)
+            summary = response.content.strip()
+        except Exception as e:
+            print(f"⚠️ Error summarising history: {e}")
+            # Fallback: giữ câu hỏi gần nhất của phần cũ
+            user_msgs = [m.get("content", "") for m in messages if m.get("role") == "user"]
+            summary = "Các câu hỏi trước: " + "; ".join(user_msgs[-3:])
+
+        self._summary_state[conv_key] = (len(messages), self._fingerprint(messages[-1]), summary)
+        if len(self._summary_state) > self._summary_state_size:
+            self._summary_state.pop(next(iter(self._summary_state)))
+
+        return summary
+
+
+if __name__ == "__main__":
+    print("✅ SummaryMemory module loaded successfully")
@@ -3,6 +3,7 @@ Query Normalization - Xử lý từ lóng và viết tắt
 Chuẩn hóa query từ sinh viên sang ngôn ngữ chuẩn trước khi xử lý
 """
 
+import functools
 import re
 from typing import Dict, List, Tuple
 
@@ -121,40 +122,52 @@ class QueryNormalizer:
         
         # Build regex pattern for efficient replacement
         self._build_pattern()
+        
+        # Memoize theo instance - mỗi normalizer cache với đúng từ điển
+        # của nó; rebuild (= invalidate) khi từ điển thay đổi
+        self._rebuild_caches()
     
     def _build_pattern(self):
         """Build regex pattern from all terms"""
-        # Sort by length (longest first) to match longer phrases first
+        # Map tra cứu lowercase -> thay thế O(1) thay vì scan cả dict mỗi match
+        self._lower_map = {k.lower(): v for k, v in self.normalization_map.items()}
+        
+        # Sort by length (longest first) to match longer phrases first.
+        # Với ~90 literal terms, alternation + memoize ở dưới là đủ nhanh;
+        # chỉ cần cân nhắc Aho-Corasick nếu từ điển lên đến hàng nghìn term
         terms = sorted(self.normalization_map.keys(), key=len, reverse=True)
         
         # Escape special regex characters and join with |
         pattern = '|'.join(re.escape(term) for term in terms)
         self.pattern = re.compile(r'\b(' + pattern + r')\b', re.IGNORECASE)
+        
+        # Callable thay thế bind 1 lần cùng pattern/_lower_map - không
+        # phải allocate closure mới trên mỗi lần normalize
+        self._replace = lambda m: self._lower_map.get(m.group(1).lower(), m.group(1))
+    
+    def _rebuild_caches(self):
+        """Tạo mới các lru_cache quanh 2 hàm impl của instance này"""
+        self._normalize_cached = functools.lru_cache(maxsize=4096)(self._normalize_impl)
+        self._explain_cached = functools.lru_cache(maxsize=1024)(self._explain_impl)
     
     def normalize(self, query: str) -> str:
         """
         Chuẩn hóa query bằng cách thay thế từ lóng/viết tắt
         
+        Kết quả được memoize (queries trong chatbot lặp lại rất nhiều) -
+        cache hit bỏ qua cả lượt regex scan.
+        
         Args:
             query: Câu hỏi gốc từ user
             
         Returns:
             Câu hỏi đã được chuẩn hóa
         """
-        normalized = query
-        
-        # Replace using regex for case-insensitive matching
-        def replace_func(match):
-            matched_text = match.group(1)
-            # Find the key in normalization_map (case-insensitive)
-            for key, value in self.normalization_map.items():
-                if key.lower() == matched_text.lower():
-                    return value
-            return matched_text
-        
-        normalized = self.pattern.sub(replace_func, normalized)
-        
-        return normalized
+        return self._normalize_cached(query)
+    
+    def _normalize_impl(self, query: str) -> str:
+        """Chạy regex sub thực sự (không cache)"""
+        return self.pattern.sub(self._replace, query)
     
     def get_explanation(self, query: str) -> List[Tuple[str, str]]:
         """
@@ -166,16 +179,19 @@ class QueryNormalizer:
         Returns:
             List of (original_term, normalized_term) tuples
         """
+        return list(self._explain_cached(query))
+    
+    def _explain_impl(self, query: str) -> Tuple[Tuple[str, str], ...]:
+        """Tìm các term sẽ được normalize (không cache)"""
         explanations = []
         
         for match in self.pattern.finditer(query):
             matched_text = match.group(1)
-            for key, value in self.normalization_map.items():
-                if key.lower() == matched_text.lower():
-                    explanations.append((matched_text, value))
-                    break
+            value = self._lower_map.get(matched_text.lower())
+            if value is not None:
+                explanations.append((matched_text, value))
         
-        return explanations
+        return tuple(explanations)
     
     def add_custom_term(self, slang: str, standard: str):
         """
@@ -187,6 +203,7 @@ class QueryNormalizer:
         """
         self.normalization_map[slang.lower()] = standard.lower()
         self._build_pattern()
+        self._rebuild_caches()  # Invalidate các kết quả đã cache
 
 
 # Global normalizer instance
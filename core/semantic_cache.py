@@ -0,0 +1,125 @@
+"""
+Semantic Cache cho Agentic RAG System
+Cache câu trả lời theo embedding của câu hỏi để bỏ qua workflow khi gặp câu hỏi tương tự
+"""
+
+import json
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+
+class SemanticCache:
+    """
+    Cache kết quả query dựa trên similarity của embeddings
+
+    Câu hỏi mới được embed và so sánh với các câu hỏi đã cache.
+    Nếu đủ giống (distance < threshold), trả về kết quả cũ ngay lập tức
+    mà không cần chạy lại toàn bộ LangGraph workflow.
+    """
+
+    def __init__(
+        self,
+        client,
+        embeddings,
+        collection_name: str = "query_cache",
+        distance_threshold: float = 0.05,
+        max_size: int = 1000,
+        ttl_seconds: int = 3600
+    ):
+        """
+        Khởi tạo Semantic Cache
+
+        Args:
+            client: chromadb client (dùng chung client với vectorstore chính)
+            embeddings: Embedding function (dùng chung model, không load thêm)
+            collection_name: Tên collection cache (tách biệt với knowledge base)
+            distance_threshold: Ngưỡng distance để coi là cache hit
+            max_size: Số lượng entries tối đa (evict entry cũ nhất khi vượt)
+            ttl_seconds: Thời gian sống của mỗi entry
+        """
+        self.embeddings = embeddings
+        self.distance_threshold = distance_threshold
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.collection = client.get_or_create_collection(collection_name)
+
+        # Track thứ tự insert để evict entry cũ nhất
+        self._insertion_order = [
+            entry_id for entry_id in self.collection.get(include=[])["ids"]
+        ]
+
+    def get(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Tìm kết quả đã cache cho câu hỏi tương tự
+
+        Args:
+            question: Câu hỏi từ user
+
+        Returns:
+            Dict {answer, confidence, citations} nếu cache hit, None nếu miss
+        """
+        if self.collection.count() == 0:
+            return None
+
+        embedding = self.embeddings.embed_query(question)
+        results = self.collection.query(query_embeddings=[embedding], n_results=1)
+
+        if not results["ids"][0]:
+            return None
+
+        distance = results["distances"][0][0]
+        if distance >= self.distance_threshold:
+            return None
+
+        metadata = results["metadatas"][0][0]
+
+        # Kiểm tra TTL - entry hết hạn coi như miss
+        if time.time() - metadata.get("cached_at", 0) > self.ttl_seconds:
+            self._evict(results["ids"][0][0])
+            return None
+
+        return {
+            "answer": metadata["answer"],
+            "confidence": metadata["confidence"],
+            "citations": json.loads(metadata["citations"])
+        }
+
+    def put(self, question: str, answer: str, confidence: float, citations: list):
+        """
+        Lưu kết quả vào cache
+
+        Args:
+            question: Câu hỏi gốc
+            answer: Câu trả lời đã format
+            confidence: Độ tin cậy
+            citations: Nguồn tham khảo
+        """
+        embedding = self.embeddings.embed_query(question)
+        entry_id = uuid.uuid4().hex
+
+        self.collection.add(
+            embeddings=[embedding],
+            metadatas=[{
+                "answer": answer,
+                "confidence": confidence,
+                "citations": json.dumps(citations, ensure_ascii=False),
+                "cached_at": time.time()
+            }],
+            ids=[entry_id]
+        )
+        self._insertion_order.append(entry_id)
+
+        # Size cap - xóa các entries cũ nhất
+        while len(self._insertion_order) > self.max_size:
+            self._evict(self._insertion_order[0])
+
+    def _evict(self, entry_id: str):
+        """Xóa một entry khỏi cache"""
+        self.collection.delete(ids=[entry_id])
+        if entry_id in self._insertion_order:
+            self._insertion_order.remove(entry_id)
+
+
+if __name__ == "__main__":
+    print("✅ SemanticCache module loaded successfully")
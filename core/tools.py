@@ -4,13 +4,167 @@ Tools cho Agentic RAG System
 """
 
 from typing import List, Dict, Any, Optional
+from dataclasses import dataclass
+import functools
 from langchain_chroma import Chroma
 from langchain_openai import ChatOpenAI
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from rank_bm25 import BM25Okapi
+import numpy as np
+import orjson
+import os
+import pickle
 import re
 from .config import model_config, vectorstore_config, agent_config
 
+# BM25 index build từ corpus khá chậm - persist xuống disk để các lần
+# khởi động sau chỉ cần load lại
+_BM25_CACHE_PATH = os.path.join("cache", "bm25.pkl")
+
+# Regex và stop words dùng trong extract keywords/entities - compile và
+# build 1 lần lúc import thay vì trên mỗi query
+_WORD_RE = re.compile(r'\w+')
+
+# Alternation gộp: 1 lượt scan lấy được cả word tokens lẫn entities
+# (Điều X, Chương Y) thay vì 3 lượt regex riêng trên cùng một chuỗi
+_TOKENIZE_RE = re.compile(r'(?P<dieu>Điều\s+\d+)|(?P<chuong>(?i:Chương\s+[IVX]+))|(?P<word>\w+)')
+
+STOP_WORDS = frozenset({
+    'là', 'của', 'và', 'có', 'được', 'trong', 'cho', 'với', 'để', 'khi',
+    'nào', 'như', 'về'
+})
+
+
+@dataclass(slots=True)
+class TokenizedQuery:
+    """Kết quả tokenize 1 query - share giữa keyword/entity extraction và BM25"""
+    lower: str
+    tokens: List[str]
+    entities: List[str]
+    
+    @classmethod
+    def from_query(cls, query: str) -> "TokenizedQuery":
+        tokens = []
+        entities = []
+        for match in _TOKENIZE_RE.finditer(query):
+            if match.lastgroup == "word":
+                tokens.append(match.group().lower())
+            else:
+                # Entity giữ nguyên case; các từ bên trong vẫn vào tokens
+                # để keyword/BM25 thấy được như trước
+                entities.append(match.group())
+                tokens.extend(w.lower() for w in _WORD_RE.findall(match.group()))
+        return cls(query.lower(), tokens, entities)
+
+
+@functools.lru_cache(maxsize=512)
+def _tokenize_query(query: str) -> TokenizedQuery:
+    """Tokenize có cache - cùng 1 query đi qua nhiều tool trong 1 turn"""
+    return TokenizedQuery.from_query(query)
+
+_JSON_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL)
+
+
+def _to_similarity(distance: float) -> float:
+    """
+    Đổi Chroma distance (nhỏ = giống) sang similarity (lớn = giống)
+    
+    1/(1+d) luôn nằm trong (0, 1] và đúng cả với L2 distance > 1, nên
+    mọi consumer phía sau (sort top-k, confidence, token budget) có thể
+    coi similarity_score là "cao hơn = liên quan hơn".
+    """
+    return 1.0 / (1.0 + distance)
+
+# Ngân sách context mặc định cho các prompt extract/validate - prefill
+# tokens tỉ lệ thuận với latency nên không nhồi cả top_k documents dài
+_MAX_CONTEXT_TOKENS = 3000
+
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+
+# tiktoken encoder load lazy (đọc file BPE lần đầu hơi chậm)
+_encoder = None
+
+
+def _get_encoder():
+    global _encoder
+    if _encoder is None:
+        import tiktoken
+        try:
+            _encoder = tiktoken.encoding_for_model(model_config.chat_model)
+        except KeyError:
+            _encoder = tiktoken.get_encoding("cl100k_base")
+    return _encoder
+
+
+def _budgeted_context(documents: List[Dict[str, Any]], max_tokens: int = _MAX_CONTEXT_TOKENS,
+                      include_type: bool = True) -> str:
+    """
+    Ghép documents thành context nhưng dừng ở ngân sách token
+    
+    Documents được xếp theo similarity score giảm dần nên phần bị cắt
+    luôn là phần ít liên quan nhất; document vượt ngân sách được cắt
+    theo ranh giới câu thay vì giữa chừng.
+    """
+    encoder = _get_encoder()
+    ranked = sorted(documents, key=lambda d: d.get("similarity_score", 0.0), reverse=True)
+    
+    pieces = []
+    remaining = max_tokens
+    for doc in ranked:
+        piece = f"[{doc['doc_type']}]\n{doc['content']}" if include_type else doc['content']
+        cost = len(encoder.encode(piece))
+        if cost <= remaining:
+            pieces.append(piece)
+            remaining -= cost
+            continue
+        # Không đủ chỗ cho cả document: nhét từng câu đến khi hết budget
+        partial = []
+        for sentence in _SENTENCE_RE.split(piece):
+            cost = len(encoder.encode(sentence))
+            if cost > remaining:
+                break
+            partial.append(sentence)
+            remaining -= cost
+        if partial:
+            pieces.append(" ".join(partial))
+        break
+    
+    return "\n\n---\n\n".join(pieces)
+
+
+def _parse_llm_json(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse JSON từ LLM output bằng orjson (nhanh hơn json stdlib ~3x)
+    
+    LLM thỉnh thoảng bọc JSON trong markdown fence hoặc thêm text xung
+    quanh - salvage các trường hợp đó thay vì vứt bỏ nguyên LLM call.
+    Trả về None nếu thực sự không parse được.
+    """
+    text = text.strip()
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        pass
+    
+    # Thử lột markdown code fence: ```json ... ```
+    match = _JSON_FENCE_RE.search(text)
+    if match:
+        try:
+            return orjson.loads(match.group(1))
+        except orjson.JSONDecodeError:
+            pass
+    
+    # Thử cắt phần giữa cặp ngoặc nhọn ngoài cùng
+    start = text.find("{")
+    end = text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            return orjson.loads(text[start:end + 1])
+        except orjson.JSONDecodeError:
+            pass
+    
+    return None
+
 
 class VectorSearchTool:
     """Tool để search trong vector database"""
@@ -18,6 +172,146 @@ class VectorSearchTool:
     def __init__(self, vectorstore: Chroma):
         self.vectorstore = vectorstore
         self.top_k = vectorstore_config.top_k
+        
+        # Cache kết quả search theo (query, k) - pipeline gửi lại cùng một
+        # query nhiều lần (speculative search, retry, reformulation trùng
+        # nhau sau normalize), mỗi hit tiết kiệm 1 lần embed + 1 ANN search
+        self._cache: Dict[tuple, List[Dict[str, Any]]] = {}
+        self._cache_size = 1024
+        
+        # BM25 sparse index (lazy build) cho hybrid retrieval - dense
+        # embedding hay miss các exact term như "Điều 15", "học phần"
+        self._bm25 = None
+        self._bm25_loaded = False
+    
+    def _get_bm25(self) -> Optional[Dict[str, Any]]:
+        """Load (hoặc build rồi persist) BM25 index trên toàn bộ corpus"""
+        if self._bm25_loaded:
+            return self._bm25
+        self._bm25_loaded = True
+        
+        try:
+            # Cache chỉ hợp lệ khi collection chưa đổi - so document count
+            # để không merge nhầm chunks đã bị xoá/sửa sau khi rebuild
+            # vector_db (count() là 1 query đếm, rẻ)
+            collection_count = self.vectorstore._collection.count()
+            
+            if os.path.exists(_BM25_CACHE_PATH):
+                with open(_BM25_CACHE_PATH, "rb") as f:
+                    cached = pickle.load(f)
+                if cached.get("collection_count") == collection_count:
+                    self._bm25 = cached
+                    return self._bm25
+                print("⚠️ BM25 cache stale (collection changed), rebuilding...")
+            
+            data = self.vectorstore._collection.get(include=["documents", "metadatas"])
+            contents = data["documents"]
+            if not contents:
+                return None
+            tokens = [_WORD_RE.findall(c.lower()) for c in contents]
+            self._bm25 = {
+                "index": BM25Okapi(tokens),
+                "contents": contents,
+                "metadatas": data["metadatas"],
+                "collection_count": collection_count
+            }
+            os.makedirs(os.path.dirname(_BM25_CACHE_PATH), exist_ok=True)
+            with open(_BM25_CACHE_PATH, "wb") as f:
+                pickle.dump(self._bm25, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            print(f"⚠️ BM25 index unavailable, dense-only retrieval: {e}")
+            self._bm25 = None
+        
+        return self._bm25
+    
+    def _hybrid_rerank(self, query: str, dense_results: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+        """
+        Kết hợp dense results với BM25 bằng Reciprocal Rank Fusion
+        
+        RRF score = Σ 1/(60 + rank) qua cả 2 bảng xếp hạng; documents chỉ
+        BM25 tìm thấy được thêm vào với similarity score trung tính để
+        không phá vỡ thang điểm confidence phía sau.
+        """
+        bm25 = self._get_bm25()
+        query_tokens = _tokenize_query(query).tokens
+        if bm25 is None or not query_tokens:
+            return dense_results
+        
+        rrf_scores: Dict[tuple, float] = {}
+        entries: Dict[tuple, Dict[str, Any]] = {}
+        
+        for rank, doc in enumerate(dense_results):
+            content = doc["content"]
+            key = (len(content), content[:64], hash(content))
+            rrf_scores[key] = rrf_scores.get(key, 0.0) + 1.0 / (60 + rank)
+            entries.setdefault(key, doc)
+        
+        scores = bm25["index"].get_scores(query_tokens)
+        if len(scores) > k:
+            top_idx = np.argpartition(scores, -k)[-k:]
+            top_idx = top_idx[np.argsort(scores[top_idx])[::-1]]
+        else:
+            top_idx = np.argsort(scores)[::-1]
+        neutral_score = dense_results[-1]["similarity_score"] if dense_results else 0.0
+        
+        for rank, idx in enumerate(top_idx):
+            if scores[idx] <= 0:
+                break
+            content = bm25["contents"][idx]
+            key = (len(content), content[:64], hash(content))
+            rrf_scores[key] = rrf_scores.get(key, 0.0) + 1.0 / (60 + rank)
+            if key not in entries:
+                metadata = bm25["metadatas"][idx] or {}
+                entries[key] = {
+                    "content": content,
+                    "metadata": metadata,
+                    "similarity_score": neutral_score,
+                    "source": metadata.get("source", "Unknown"),
+                    "doc_type": metadata.get("doc_type", "Unknown")
+                }
+        
+        ranked = sorted(rrf_scores, key=rrf_scores.get, reverse=True)[:k]
+        return [entries[key] for key in ranked]
+    
+    def _cache_put(self, key: tuple, results: List[Dict[str, Any]]):
+        """Lưu kết quả vào cache với size cap đơn giản"""
+        self._cache[key] = results
+        if len(self._cache) > self._cache_size:
+            self._cache.pop(next(iter(self._cache)))
+    
+    def search_raw(self, query: str, k: Optional[int] = None) -> tuple:
+        """
+        Search trả về dạng raw: (content, metadata) pairs + scores ndarray
+        
+        Không box từng kết quả thành dict - caller cần xử lý điểm số hàng
+        loạt (RRF, re-ranking) làm việc thẳng trên ndarray, chỉ
+        materialize dict cho những document thực sự được dùng.
+        
+        Args:
+            query: Câu query
+            k: Số lượng kết quả (mặc định dùng config)
+        
+        Returns:
+            Tuple (docs, scores): docs là list (content, metadata),
+            scores là np.ndarray cùng thứ tự
+        """
+        k = k or self.top_k
+        
+        # Embed query 1 lần (đi qua embedding cache) rồi query thẳng
+        # collection, bỏ qua lớp LangChain wrapper - cùng đường đi với
+        # batch_search
+        embedding = self.vectorstore._embedding_function.embed_query(query)
+        raw = self.vectorstore._collection.query(
+            query_embeddings=[embedding],
+            n_results=k,
+            include=["documents", "metadatas", "distances"]
+        )
+        
+        docs = list(zip(raw["documents"][0], raw["metadatas"][0]))
+        # Raw distances từ Chroma (nhỏ = giống) - search() mới đổi sang
+        # similarity khi materialize dicts
+        scores = np.asarray(raw["distances"][0], dtype=np.float64)
+        return docs, scores
     
     def search(self, query: str, k: Optional[int] = None) -> List[Dict[str, Any]]:
         """
@@ -32,21 +326,86 @@ class VectorSearchTool:
         """
         k = k or self.top_k
         
-        # Similarity search với scores
-        results = self.vectorstore.similarity_search_with_score(query, k=k)
+        cache_key = (query, k)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        docs, scores = self.search_raw(query, k)
         
         formatted_results = []
-        for doc, score in results:
+        for (content, metadata), score in zip(docs, scores):
+            metadata = metadata or {}
             formatted_results.append({
-                "content": doc.page_content,
-                "metadata": doc.metadata,
-                "similarity_score": float(score),
-                "source": doc.metadata.get("source", "Unknown"),
-                "doc_type": doc.metadata.get("doc_type", "Unknown")
+                "content": content,
+                "metadata": metadata,
+                "similarity_score": _to_similarity(float(score)),
+                "source": metadata.get("source", "Unknown"),
+                "doc_type": metadata.get("doc_type", "Unknown")
             })
         
+        # Hybrid: RRF-merge với BM25 để không miss exact-term matches
+        formatted_results = self._hybrid_rerank(query, formatted_results, k)
+        
+        self._cache_put(cache_key, formatted_results)
         return formatted_results
     
+    def batch_search(self, queries: List[str], k: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Search nhiều queries trong MỘT lần gọi Chroma
+        
+        Embed toàn bộ queries một lượt (sentence-transformers batch hiệu
+        quả hơn nhiều so với N forward passes riêng lẻ) rồi query Chroma
+        với nhiều vectors cùng lúc thay vì N round trips.
+        
+        Args:
+            queries: Danh sách queries
+            k: Số lượng kết quả mỗi query (mặc định dùng config)
+        
+        Returns:
+            List kết quả theo từng query (cùng format với search())
+        """
+        k = k or self.top_k
+        
+        if len(queries) == 1:
+            return [self.search(queries[0], k=k)]
+        
+        # Chỉ embed + search các queries chưa có trong cache
+        results_by_query = {
+            q: self._cache.get((q, k)) for q in queries
+        }
+        missing = [q for q, r in results_by_query.items() if r is None]
+        
+        if missing:
+            embeddings = self.vectorstore._embedding_function.embed_documents(missing)
+            raw = self.vectorstore._collection.query(
+                query_embeddings=embeddings,
+                n_results=k,
+                include=["documents", "metadatas", "distances"]
+            )
+            
+            for query, contents, metadatas, distances in zip(
+                missing, raw["documents"], raw["metadatas"], raw["distances"]
+            ):
+                formatted_results = []
+                for content, metadata, distance in zip(contents, metadatas, distances):
+                    metadata = metadata or {}
+                    formatted_results.append({
+                        "content": content,
+                        "metadata": metadata,
+                        "similarity_score": _to_similarity(float(distance)),
+                        "source": metadata.get("source", "Unknown"),
+                        "doc_type": metadata.get("doc_type", "Unknown")
+                    })
+                # Cùng hybrid RRF-merge như search() - cache chung (query, k)
+                # nên 2 đường đi phải trả về cùng một kết quả
+                formatted_results = self._hybrid_rerank(query, formatted_results, k)
+
+                results_by_query[query] = formatted_results
+                self._cache_put((query, k), formatted_results)
+        
+        return [results_by_query[q] for q in queries]
+    
     def search_with_filter(self, query: str, filter_dict: Dict[str, Any], k: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Search với metadata filtering
@@ -69,7 +428,7 @@ class VectorSearchTool:
             formatted_results.append({
                 "content": doc.page_content,
                 "metadata": doc.metadata,
-                "similarity_score": float(score)
+                "similarity_score": _to_similarity(float(score))
             })
         
         return formatted_results
@@ -131,6 +490,9 @@ class QueryAnalysisTool:
     
     def __init__(self, llm: ChatOpenAI):
         self.llm = llm
+        # JSON mode: GPT đảm bảo trả về JSON hợp lệ, gần như không bao giờ
+        # rơi vào fallback path nữa
+        self._json_llm = llm.bind(response_format={"type": "json_object"})
     
     def analyze(self, query: str) -> Dict[str, Any]:
         """
@@ -157,13 +519,10 @@ Hãy trả về phân tích theo format JSON với các trường:
 
 Chỉ trả về JSON, không giải thích thêm."""
 
-        response = self.llm.invoke(prompt)
+        response = self._json_llm.invoke(prompt)
         
-        # Parse JSON response
-        import json
-        try:
-            result = json.loads(response.content.strip())
-        except:
+        result = _parse_llm_json(response.content)
+        if result is None:
             # Fallback nếu không parse được
             result = {
                 "intent": "query",
@@ -177,24 +536,15 @@ Chỉ trả về JSON, không giải thích thêm."""
     
     def _extract_keywords(self, query: str) -> List[str]:
         """Extract keywords đơn giản bằng regex"""
-        # Loại bỏ stop words tiếng Việt cơ bản
-        stop_words = {'là', 'của', 'và', 'có', 'được', 'trong', 'cho', 'với', 'để', 'khi', 'nào', 'như', 'về'}
-        words = re.findall(r'\w+', query.lower())
-        return [w for w in words if w not in stop_words and len(w) > 2]
+        # Loại bỏ stop words tiếng Việt cơ bản (frozenset ở module scope)
+        return [
+            w for w in _tokenize_query(query).tokens
+            if w not in STOP_WORDS and len(w) > 2
+        ]
     
     def _extract_entities(self, query: str) -> List[str]:
         """Extract entities như Điều X, Chương Y"""
-        entities = []
-        
-        # Extract Điều X
-        dieu_matches = re.findall(r'Điều\s+\d+', query)
-        entities.extend(dieu_matches)
-        
-        # Extract Chương X
-        chuong_matches = re.findall(r'Chương\s+[IVX]+', query, re.IGNORECASE)
-        entities.extend(chuong_matches)
-        
-        return entities
+        return _tokenize_query(query).entities
 
 
 class InformationExtractionTool:
@@ -214,11 +564,8 @@ class InformationExtractionTool:
         Returns:
             Thông tin đã được trích xuất và tổng hợp
         """
-        # Tạo context từ documents
-        context = "\n\n---\n\n".join([
-            f"[{doc['doc_type']}]\n{doc['content']}" 
-            for doc in documents
-        ])
+        # Tạo context từ documents, giới hạn theo ngân sách token
+        context = _budgeted_context(documents)
         
         prompt = f"""Dựa vào các đoạn văn bản sau từ quy chế đào tạo, hãy trích xuất thông tin trả lời câu hỏi.
 
@@ -238,6 +585,7 @@ class ValidationTool:
     
     def __init__(self, llm: ChatOpenAI):
         self.llm = llm
+        self._json_llm = llm.bind(response_format={"type": "json_object"})
     
     def validate(self, query: str, answer: str, source_documents: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
@@ -250,7 +598,7 @@ class ValidationTool:
             - issues: List các vấn đề (nếu có)
             - suggestions: Gợi ý cải thiện
         """
-        context = "\n".join([doc['content'] for doc in source_documents])
+        context = _budgeted_context(source_documents, include_type=False)
         
         prompt = f"""Đánh giá chất lượng câu trả lời sau:
 
@@ -277,12 +625,10 @@ Trả về JSON với format:
 
 Chỉ trả về JSON, không giải thích."""
 
-        response = self.llm.invoke(prompt)
+        response = self._json_llm.invoke(prompt)
         
-        import json
-        try:
-            result = json.loads(response.content.strip())
-        except:
+        result = _parse_llm_json(response.content)
+        if result is None:
             # Fallback
             result = {
                 "is_valid": True,
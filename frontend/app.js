@@ -9,6 +9,7 @@ const API_BASE_URL = 'http://localhost:8000/api';
 // State
 let currentSessionId = null;
 let conversations = [];
+let conversationsNextCursor = null;
 let isLoading = false;
 let deleteTargetSessionId = null;
 
@@ -99,11 +100,16 @@ async function sendMessage(message) {
     }
 }
 
-async function loadConversations() {
+async function loadConversations(loadMore = false) {
     try {
-        const response = await fetch(`${API_BASE_URL}/conversations`);
+        // Keyset pagination: "next" is the updated_at cursor from the previous page
+        const url = loadMore && conversationsNextCursor
+            ? `${API_BASE_URL}/conversations?before=${encodeURIComponent(conversationsNextCursor)}`
+            : `${API_BASE_URL}/conversations`;
+        const response = await fetch(url);
         const data = await response.json();
-        conversations = data;
+        conversations = loadMore ? conversations.concat(data.items) : data.items;
+        conversationsNextCursor = data.next;
         renderConversationsList();
     } catch (error) {
         console.error('Error loading conversations:', error);
@@ -390,6 +396,15 @@ function renderConversationsList() {
         
         elements.conversationsList.appendChild(convDiv);
     });
+    
+    // More pages available -> button to load older conversations
+    if (conversationsNextCursor) {
+        const loadMoreBtn = document.createElement('button');
+        loadMoreBtn.className = 'btn-load-more-conversations';
+        loadMoreBtn.textContent = 'Tải thêm...';
+        loadMoreBtn.onclick = () => loadConversations(true);
+        elements.conversationsList.appendChild(loadMoreBtn);
+    }
 }
 
 async function switchConversation(sessionId) {